@@ -1,7 +1,10 @@
 
+import logging
 import requests
 import json
 
+logger = logging.getLogger(__name__)
+
 API_URL = "https://pr-az-pro-ai-ca-fw-uab11.livelyhill-0e586e2e.northeurope.azurecontainerapps.io/api/v1/prediction/1d9e7016-0dc7-4b1b-b9b0-9309a192a067"
 
 def query(input_json, input_person):
@@ -32,7 +35,7 @@ def query(input_json, input_person):
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error al hacer la solicitud: {e}")
+        logger.warning("Error al hacer la solicitud: %s", e)
         return f"Lo siento, hubo un error al procesar tu consulta: {str(e)}"
 
 # Para pruebas locales
@@ -1,7 +1,10 @@
 
+import logging
 import requests
 import json
 
+logger = logging.getLogger(__name__)
+
 data = '''
 {
   "resumen_datos": {
@@ -366,7 +369,7 @@ def query(user_message, data, prompt):
         response.raise_for_status()  # Esto lanzará una excepción para códigos de estado HTTP 4xx/5xx
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error al hacer la solicitud: {e}")
+        logger.warning("Error al hacer la solicitud: %s", e)
         return {"text": f"Lo siento, ha ocurrido un error: {str(e)}"}
 
 # Esta parte solo se ejecuta si el script se corre directamente (para pruebas)
@@ -1,7 +1,10 @@
 
+import logging
 import requests
 import json
 
+logger = logging.getLogger(__name__)
+
 
 def query(user_message, info_web, user_data):
     API_URL = "https://pr-az-pro-ai-ca-fw-uab11.livelyhill-0e586e2e.northeurope.azurecontainerapps.io/api/v1/prediction/aaa92823-3669-4804-baf4-241a65f8d58f"
@@ -21,7 +24,7 @@ def query(user_message, info_web, user_data):
         response.raise_for_status()  # Esto lanzará una excepción para códigos de estado HTTP 4xx/5xx
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error al hacer la solicitud: {e}")
+        logger.warning("Error al hacer la solicitud: %s", e)
         return {"text": f"Lo siento, ha ocurrido un error: {str(e)}"}
 
 # Esta parte solo se ejecuta si el script se corre directamente (para pruebas)
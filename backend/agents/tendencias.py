@@ -1,9 +1,12 @@
 
+import logging
 import requests
 import json
 import random
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 # Sector por defecto para pruebas
 sector_cliente = "Mercado de muelles"
 
@@ -53,7 +56,7 @@ def query(user_message, sector_cliente, pais_cliente):
         
         return result
     except Exception as e:
-        print(f"Error al hacer la solicitud: {e}")
+        logger.warning("Error al hacer la solicitud: %s", e)
         # En caso de error, devolver solo datos simulados
         trends_data = generate_market_trends_data(sector_cliente, pais_cliente)
         return {
@@ -9,9 +9,12 @@ from sklearn.metrics import classification_report, confusion_matrix, mean_square
 from sklearn.inspection import permutation_importance
 from sklearn.impute import SimpleImputer
 import json
+import logging
 import warnings
 warnings.filterwarnings('ignore')
 
+logger = logging.getLogger(__name__)
+
 def analizar_datos_pyme_mejorado(dataframe, target_variable, tipo_problema='clasificacion', max_features_vis=10, top_n_features_insight=3):
     """
     Analiza automáticamente un dataframe y extrae información relevante para PYMEs. (Versión Mejorada)
@@ -62,8 +65,8 @@ def analizar_datos_pyme_mejorado(dataframe, target_variable, tipo_problema='clas
     columnas_numericas = df[all_feature_columns].select_dtypes(include=['int64', 'float64']).columns.tolist()
     columnas_categoricas = df[all_feature_columns].select_dtypes(include=['object', 'category', 'bool']).columns.tolist()
 
-    print(f"Numeric columns identified: {len(columnas_numericas)}") # Debugging print
-    print(f"Categorical columns identified: {len(columnas_categoricas)}") # Debugging print
+    logger.debug("Numeric columns identified: %d", len(columnas_numericas))
+    logger.debug("Categorical columns identified: %d", len(columnas_categoricas))
 
     # 1. ANÁLISIS BÁSICO DE DATOS
     resultados['resumen_datos'] = {
@@ -302,7 +305,7 @@ def analizar_datos_pyme_mejorado(dataframe, target_variable, tipo_problema='clas
     except Exception as e:
         resultados['importancia_features'] = {'error': str(e)}
         resultados['insights'].append(f"Error al calcular la importancia de las características: {str(e)}") # Insight de error más descriptivo
-        print(f"Error in feature importance: {e}") # Print full error for debugging
+        logger.warning("Error in feature importance: %s", e)
 
 
     # 8. DATOS PARA VISUALIZACIÓN DE RELACIÓN FEATURE VS TARGET
@@ -1,38 +1,67 @@
 
 import os
+import asyncio
+import hmac
+import logging
+import hashlib
+import time
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
 from fastapi import HTTPException, Header, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
-from pymongo import MongoClient
 from dotenv import load_dotenv
 from models import UserCreate, UserLogin
+import database
+from cache import TTLCache
+from executors import BoundedExecutor, ExecutorSaturatedError, default_workers
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configuración de seguridad
 # Usar un esquema más simple para evitar problemas con bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
-# Conectar a MongoDB
-mongo_uri = os.getenv("MONGO_URI")
-client = MongoClient(mongo_uri)
-db = client["pyme360"]
-users_collection = db["users"]  # Colección de usuarios
-
 # Clave secreta para JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "UN_SECRETO_MUY_SEGURO")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60  # Extender a 60 minutos para dar más tiempo
 
+# Caché de usuarios autenticados. Cada escritura (invalidate_user) elimina
+# las entradas del usuario e incrementa una generación global; una lectura
+# de MongoDB solo se guarda si ninguna invalidación ocurrió mientras duraba,
+# así que una lectura concurrente con una escritura nunca deja un documento
+# obsoleto accesible. Las escrituras hechas desde otros workers o procesos
+# (rescore_job, migraciones) marcan el documento con
+# database.USERS_UPDATED_AT_FIELD, y cada worker invalida los usuarios
+# marcados cada USER_CACHE_SYNC_SECONDS (sync_user_cache). Un documento
+# borrado no deja marca: en los demás workers solo expira con el TTL.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_MAXSIZE", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+)
+USER_CACHE_SYNC_SECONDS = float(os.getenv("USER_CACHE_SYNC_SECONDS", "2"))
+_user_cache_generation = 0
+
+def invalidate_user(username: Optional[str] = None):
+    """Invalida el usuario en la caché; sin username, invalida todos."""
+    global _user_cache_generation
+    _user_cache_generation += 1
+    if username is None:
+        user_cache.clear()
+        return
+    user_cache.pop_where(lambda key: key[0] == username)
+
 def verify_password(plain_password, hashed_password):
     try:
         return pwd_context.verify(plain_password, hashed_password)
     except Exception as e:
-        print(f"Error verificando contraseña: {e}")
+        logger.warning("Error verificando contraseña: %s", e)
         # En caso de error con bcrypt, verificar de manera simple (solo para desarrollo)
         # Esto NO es seguro para producción, pero ayuda durante el desarrollo
         try:
@@ -45,11 +74,46 @@ def get_password_hash(password):
     try:
         return pwd_context.hash(password)
     except Exception as e:
-        print(f"Error hasheando contraseña: {e}")
+        logger.warning("Error hasheando contraseña: %s", e)
         # En caso de error con bcrypt, devolver la contraseña sin hashear (solo para desarrollo)
         # Esto NO es seguro para producción, pero ayuda durante el desarrollo
         return password  # No es seguro para producción
 
+# bcrypt consume ~200 ms de CPU por llamada: se ejecuta en un pool propio,
+# acotado, para que un pico de logins no congele el resto de la API
+password_executor = BoundedExecutor(
+    "bcrypt",
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(default_workers()))),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+)
+
+async def _run_password_task(fn, *args):
+    try:
+        return await password_executor.run(fn, *args)
+    except ExecutorSaturatedError:
+        logger.warning("Cola de hashing de contraseñas saturada")
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de autenticación saturado, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": "2"},
+        )
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_password_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_password_task(get_password_hash, password)
+
+# Token compartido para operaciones de administración (p. ej. el alta
+# masiva). Si no está configurado, esas operaciones quedan deshabilitadas.
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Operación de administración deshabilitada")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -57,66 +121,212 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_user_by_username(username: str):
+async def get_user_by_username(username: str, projection: Optional[Dict] = None):
     try:
-        user = users_collection.find_one({"username": username})
-        print(f"Usuario encontrado: {user is not None}")
+        user = await database.get_collection("users").find_one({"username": username}, projection)
+        logger.debug("Usuario encontrado: %s", user is not None)
         return user
-    except Exception as e:
-        print(f"Error buscando usuario: {e}")
+    except Exception:
+        logger.exception("Error buscando usuario")
         return None
 
-def authenticate_user(username: str, password: str):
+async def authenticate_user(username: str, password: str):
     try:
-        user = get_user_by_username(username)
+        user = await get_user_by_username(username)
         if not user:
-            print(f"Usuario {username} no encontrado")
+            logger.debug("Usuario %s no encontrado", username)
             return False
         
         # Asegurarnos de que la contraseña esté en el formato correcto
         if not isinstance(password, str):
-            print("La contraseña no es una cadena de texto")
+            logger.debug("La contraseña no es una cadena de texto")
             return False
             
         # Intentar verificar la contraseña
         hashed_password = user.get("password")
         if not hashed_password:
-            print(f"Usuario {username} no tiene contraseña hasheada")
+            logger.warning("Usuario %s no tiene contraseña hasheada", username)
             return False
             
-        if not verify_password(password, hashed_password):
-            print(f"Contraseña incorrecta para {username}")
+        if not await verify_password_async(password, hashed_password):
+            logger.debug("Contraseña incorrecta para %s", username)
             
             # Verificación alternativa: comprobar si coincide con contrasena en informacion_general
             # Solo para desarrollo, NO HACER ESTO EN PRODUCCIÓN
             informacion_general = user.get("informacion_general", {})
             if informacion_general and informacion_general.get("contrasena") == password:
-                print(f"Autenticación exitosa para {username} usando contrasena en informacion_general")
+                logger.debug("Autenticación exitosa para %s usando contrasena en informacion_general", username)
                 return user
                 
             return False
             
-        print(f"Autenticación exitosa para {username}")
+        logger.debug("Autenticación exitosa para %s", username)
         return user
-    except Exception as e:
-        print(f"Error durante la autenticación: {e}")
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error durante la autenticación")
         return False
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
+# Tokens ya verificados: digest del token -> payload decodificado, hasta su
+# "exp". Un acierto evita repetir la verificación HMAC en cada petición.
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_MAXSIZE", "4096")),
+    ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+# Tokens revocados (logout): digest -> "exp" del token. Se guardan en la
+# colección revoked_tokens (índice TTL sobre exp, compartida por todos los
+# workers) y en este diccionario local, que nunca expulsa una revocación antes
+# de su exp: crece en lugar de olvidar. Cada worker recoge las revocaciones
+# de los demás cada REVOKED_TOKENS_SYNC_SECONDS (sync_revoked_tokens).
+REVOKED_TOKENS_COLLECTION = "revoked_tokens"
+REVOKED_TOKENS_SYNC_SECONDS = float(os.getenv("REVOKED_TOKENS_SYNC_SECONDS", "5"))
+revoked_tokens: Dict[str, float] = {}
+
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def decode_access_token(token: str) -> Dict:
+    """Decodifica y verifica un JWT, reutilizando el resultado si ya se verificó."""
+    digest = _token_digest(token)
+    if digest in revoked_tokens:
+        raise jwt.InvalidTokenError("Token revocado")
+    
+    payload = token_cache.get(digest)
+    if payload is None:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        remaining = payload.get("exp", 0) - time.time()
+        if remaining > 0:
+            token_cache.set(digest, payload, ttl=remaining)
+    return payload
+
+def _mark_revoked(digest: str, exp: float):
+    revoked_tokens[digest] = exp
+    token_cache.pop(digest)
+
+async def revoke_token(token: str):
+    """Revoca un token hasta su expiración, en este worker y en la colección compartida."""
+    digest = _token_digest(token)
+    token_cache.pop(digest)
+    try:
+        exp = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("exp", 0)
+    except jwt.PyJWTError:
+        return  # Un token inválido o expirado ya no se acepta
+    _mark_revoked(digest, exp)
+    await database.get_collection(REVOKED_TOKENS_COLLECTION).update_one(
+        {"_id": digest},
+        {"$set": {
+            "exp": datetime.fromtimestamp(exp, tz=timezone.utc),
+            "revoked_at": datetime.now(timezone.utc),
+        }},
+        upsert=True
+    )
+
+async def load_revoked_tokens(since: Optional[datetime] = None) -> int:
+    """Trae las revocaciones (de cualquier worker) posteriores a since y purga las expiradas."""
+    now = time.time()
+    for digest in [digest for digest, exp in revoked_tokens.items() if exp <= now]:
+        del revoked_tokens[digest]
+
+    query = {"exp": {"$gt": datetime.now(timezone.utc)}}
+    if since is not None:
+        query["revoked_at"] = {"$gte": since}
+    loaded = 0
+    async for doc in database.get_collection(REVOKED_TOKENS_COLLECTION).find(query, {"exp": 1}):
+        exp = doc["exp"]
+        if exp.tzinfo is None:
+            exp = exp.replace(tzinfo=timezone.utc)
+        _mark_revoked(doc["_id"], exp.timestamp())
+        loaded += 1
+    return loaded
+
+async def invalidate_updated_users(since: datetime) -> int:
+    """Invalida los usuarios escritos (por cualquier worker) desde since."""
+    global _user_cache_generation
+    query = {database.USERS_UPDATED_AT_FIELD: {"$gte": since}}
+    usernames = set()
+    async for doc in database.get_collection("users").find(query, {"_id": 0, "username": 1}):
+        usernames.add(doc.get("username"))
+    if usernames:
+        # Un solo recorrido de la caché aunque rescore_job haya escrito a toda la colección
+        _user_cache_generation += 1
+        user_cache.pop_where(lambda key: key[0] in usernames)
+    return len(usernames)
+
+async def sync_user_cache():
+    # Al arrancar la caché está vacía: basta con los cambios desde ahora
+    last_sync = datetime.now(timezone.utc) - timedelta(seconds=1)
+    while True:
+        await asyncio.sleep(USER_CACHE_SYNC_SECONDS)
+        # Solape de un segundo para no perder escrituras concurrentes con la consulta
+        started = datetime.now(timezone.utc) - timedelta(seconds=1)
+        try:
+            await invalidate_updated_users(last_sync)
+            last_sync = started
+        except Exception:
+            logger.exception("Error sincronizando la caché de usuarios")
+
+async def sync_revoked_tokens():
+    last_sync = None
+    while True:
+        # Solape de un segundo para no perder revocaciones concurrentes con la consulta
+        started = datetime.now(timezone.utc) - timedelta(seconds=1)
+        try:
+            await load_revoked_tokens(last_sync)
+            last_sync = started
+        except Exception:
+            logger.exception("Error sincronizando los tokens revocados")
+        await asyncio.sleep(REVOKED_TOKENS_SYNC_SECONDS)
+
+def get_username_from_token(token: str) -> str:
+    try:
+        payload = decode_access_token(token)
         username = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Token de autenticación inválido")
     except jwt.ExpiredSignatureError:
-        print("Token expirado")
+        logger.debug("Token expirado")
         raise HTTPException(status_code=401, detail="Token de autenticación expirado")
     except jwt.PyJWTError as e:
-        print(f"Error al decodificar JWT: {e}")
+        logger.debug("Error al decodificar JWT: %s", e)
         raise HTTPException(status_code=401, detail="Token de autenticación inválido")
     
-    user = get_user_by_username(username)
+    return username
+
+async def load_current_user(token: str, projection: Dict):
+    username = get_username_from_token(token)
+    
+    cache_key = (username, tuple(sorted(projection.items())))
+    user = user_cache.get(cache_key)
     if user is None:
-        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+        generation = _user_cache_generation
+        user = await get_user_by_username(username, projection)
+        if user is None:
+            raise HTTPException(status_code=401, detail="Usuario no encontrado")
+        if generation == _user_cache_generation:
+            user_cache.set(cache_key, user)
     
+    # El documento se comparte entre peticiones: es de solo lectura, y quien
+    # necesite modificarlo debe copiarlo antes
     return user
+
+# Proyección por defecto: el documento completo salvo el hash de la contraseña
+# y las puntuaciones materializadas (ver score_store.py)
+USER_PROJECTION_SIN_PASSWORD = {"password": 0, "scores_materializados": 0}
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await load_current_user(token, USER_PROJECTION_SIN_PASSWORD)
+
+def get_current_user_fields(*fields: str):
+    """
+    Crea una dependencia que carga solo los campos indicados del usuario
+    (admite rutas con punto, p. ej. "informacion_general.sector"), para que
+    cada endpoint lea únicamente los subdocumentos que utiliza.
+    """
+    projection = {"username": 1}
+    projection.update({field: 1 for field in fields})
+    
+    async def get_current_user_projected(token: str = Depends(oauth2_scheme)):
+        return await load_current_user(token, projection)
+    
+    return get_current_user_projected
@@ -0,0 +1,73 @@
+"""
+Microbenchmark del coste de autenticación por petición.
+
+Compara la verificación completa del JWT (jwt.decode con HMAC) con la
+ruta cacheada de auth.get_username_from_token, repartiendo las peticiones
+entre varios tokens activos como haría un pico de tráfico real.
+
+    python benchmarks/bench_auth.py --tokens 1000 --peticiones 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import jwt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+
+
+def medir(nombre: str, fn, tokens: list, peticiones: int) -> dict:
+    n_tokens = len(tokens)
+    inicio = time.perf_counter()
+    for i in range(peticiones):
+        fn(tokens[i % n_tokens])
+    duracion = time.perf_counter() - inicio
+    return {
+        "caso": nombre,
+        "peticiones": peticiones,
+        "us_por_peticion": round(duracion / peticiones * 1e6, 3),
+        "peticiones_por_segundo_por_nucleo": int(peticiones / duracion),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark de verificación de JWT")
+    parser.add_argument("--tokens", type=int, default=1000, help="Tokens activos distintos")
+    parser.add_argument("--peticiones", type=int, default=200000)
+    parser.add_argument("--salida", help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    tokens = [auth.create_access_token({"sub": f"usuario{i}"}) for i in range(args.tokens)]
+
+    def sin_cache(token):
+        return jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])["sub"]
+
+    def cache_fria(token):
+        auth.token_cache.clear()
+        return auth.get_username_from_token(token)
+
+    resultados = [
+        medir("jwt.decode", sin_cache, tokens, args.peticiones),
+        medir("cache_fria", cache_fria, tokens, args.peticiones),
+    ]
+
+    auth.token_cache.clear()
+    for token in tokens:
+        auth.get_username_from_token(token)
+    resultados.append(medir("cache_caliente", auth.get_username_from_token, tokens, args.peticiones))
+    resultados.append({"token_cache": auth.token_cache.stats()})
+
+    for resultado in resultados:
+        print(json.dumps(resultado))
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark de concurrencia para la API.
+
+Lanza N clientes concurrentes contra un servidor ya arrancado y mide
+peticiones por segundo y latencias para cada nivel de concurrencia.
+Para comparar antes/después, arrancar el servidor en cada versión del
+código y ejecutar el script con los mismos parámetros:
+
+    uvicorn main:app --port 8000
+    python benchmarks/bench_concurrencia.py --username demo --password demo
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+async def obtener_token(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password},
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def cliente(client: httpx.AsyncClient, endpoint: str, headers: dict, fin: float, latencias: list, errores: list):
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            response = await client.get(endpoint, headers=headers)
+            if response.status_code != 200:
+                errores.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errores.append(type(e).__name__)
+            continue
+        latencias.append(time.perf_counter() - inicio)
+
+
+async def medir(base_url: str, endpoint: str, token: str, concurrencia: int, duracion: float) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    latencias, errores = [], []
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limites, timeout=30.0) as client:
+        fin = time.perf_counter() + duracion
+        await asyncio.gather(*(
+            cliente(client, endpoint, headers, fin, latencias, errores)
+            for _ in range(concurrencia)
+        ))
+
+    latencias.sort()
+    return {
+        "concurrencia": concurrencia,
+        "peticiones": len(latencias),
+        "errores": len(errores),
+        "rps": round(len(latencias) / duracion, 1),
+        "p50_ms": round(statistics.median(latencias) * 1000, 2) if latencias else None,
+        "p99_ms": round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000, 2) if latencias else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia de la API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/api/auth/me")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[50, 100, 200, 500])
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos por nivel de concurrencia")
+    parser.add_argument("--salida", help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.base_url) as client:
+        token = await obtener_token(client, args.username, args.password)
+
+    resultados = []
+    for concurrencia in args.concurrencia:
+        resultado = await medir(args.base_url, args.endpoint, token, concurrencia, args.duracion)
+        print(json.dumps(resultado))
+        resultados.append(resultado)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"endpoint": args.endpoint, "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Benchmark de puntuación de carteras: calculate_credit_score empresa a
+empresa frente a portfolio_scoring.score_portfolio vectorizado.
+
+    python benchmarks/bench_portfolio_scoring.py --empresas 1000 10000 100000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datos_sinteticos  # noqa: E402
+import portfolio_scoring  # noqa: E402
+import score_calculator  # noqa: E402
+
+
+def _normalizar(resultado: dict) -> dict:
+    # El orden de "types" depende de un set en la versión por usuario
+    mix = resultado["components"]["credit_mix"]
+    mix["types"] = sorted(mix["types"])
+    return resultado
+
+
+def _cronometrar(fn):
+    """Ejecuta fn() con el recolector de basura desactivado, como timeit."""
+    gc.collect()
+    gc.disable()
+    try:
+        inicio = time.perf_counter()
+        resultado = fn()
+        return resultado, time.perf_counter() - inicio
+    finally:
+        gc.enable()
+
+
+def medir(num_empresas: int, now: datetime) -> dict:
+    usuarios = datos_sinteticos.cartera(num_empresas)
+
+    # Calentamiento: carga del scorecard y primeras llamadas de NumPy
+    score_calculator.calculate_credit_score(usuarios[0], now)
+    portfolio_scoring.score_portfolio(usuarios[:10], now)
+
+    esperado, t_por_usuario = _cronometrar(
+        lambda: [score_calculator.calculate_credit_score(u, now) for u in usuarios]
+    )
+    _, t_arrays = _cronometrar(lambda: portfolio_scoring.score_portfolio_arrays(usuarios, now))
+    obtenido, t_completo = _cronometrar(lambda: portfolio_scoring.score_portfolio(usuarios, now))
+
+    diferencias = sum(
+        1 for e, o in zip(esperado, obtenido)
+        if _normalizar(e) != _normalizar(o)
+    )
+
+    return {
+        "empresas": num_empresas,
+        "por_usuario_s": round(t_por_usuario, 3),
+        "vectorizado_arrays_s": round(t_arrays, 3),
+        "vectorizado_completo_s": round(t_completo, 3),
+        "empresas_por_segundo_por_usuario": int(num_empresas / t_por_usuario),
+        "empresas_por_segundo_vectorizado": int(num_empresas / t_arrays),
+        "empresas_por_segundo_vectorizado_completo": int(num_empresas / t_completo),
+        "diferencias": diferencias,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de puntuación de carteras")
+    parser.add_argument("--empresas", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--salida", help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    now = datetime.now()
+    resultados = []
+    for num_empresas in args.empresas:
+        resultado = medir(num_empresas, now)
+        print(json.dumps(resultado))
+        resultados.append(resultado)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
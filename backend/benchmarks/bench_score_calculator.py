@@ -0,0 +1,189 @@
+"""
+Benchmark de score_calculator: latencia y asignaciones de memoria de cada
+componente y de las puntuaciones completas, para empresas desde 1 hasta
+10.000 cuentas y 100.000 pagos.
+
+    python benchmarks/bench_score_calculator.py --salida resultados.json
+    python benchmarks/bench_score_calculator.py --comparar resultados.json
+
+Con --comparar se marca como regresión cualquier función cuya mediana sea
+más lenta que la de la ejecución de referencia en más de --tolerancia.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datos_sinteticos  # noqa: E402
+import date_normalization  # noqa: E402
+import score_calculator  # noqa: E402
+import scorecard  # noqa: E402
+
+# (cuentas de crédito, pagos por cuenta)
+ESCALAS = [
+    (1, 12),
+    (10, 12),
+    (100, 100),
+    (1000, 100),
+    (10000, 10),
+]
+
+
+def _componente(card: scorecard.Scorecard, nombre: str, now: datetime):
+    return lambda u: card.evaluate_component(nombre, u["historial_crediticio"], now)
+
+
+def funciones(now: datetime):
+    card = scorecard.get_scorecard()
+    # Cada componente se mide con su propio evaluador, sin calcular los demás
+    por_componente = {nombre: _componente(card, nombre, now) for nombre in card.components}
+    return {
+        **por_componente,
+        "evaluate_components": lambda u: card.evaluate_components(u, now),
+        "calculate_credit_score": lambda u: score_calculator.calculate_credit_score(u, now),
+        "calculate_trust_score": lambda u: score_calculator.calculate_trust_score(u),
+    }
+
+
+def generar_empresa(num_cuentas: int, pagos_por_cuenta: int, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    usuario = datos_sinteticos.empresa(
+        rng, 0,
+        num_cuentas=num_cuentas,
+        num_proveedores=max(1, num_cuentas // 10),
+        pagos_por_cuenta=pagos_por_cuenta,
+        num_solicitudes=min(num_cuentas, 20),
+    )
+    return date_normalization.normalize_document(usuario)
+
+
+def medir_latencia(fn, usuario, presupuesto_s: float, min_repeticiones: int = 5) -> dict:
+    tiempos = []
+    inicio_total = time.perf_counter()
+    while len(tiempos) < min_repeticiones or time.perf_counter() - inicio_total < presupuesto_s:
+        inicio = time.perf_counter()
+        fn(usuario)
+        tiempos.append(time.perf_counter() - inicio)
+        if len(tiempos) >= 10000:
+            break
+    tiempos.sort()
+    return {
+        "repeticiones": len(tiempos),
+        "min_us": round(tiempos[0] * 1e6, 2),
+        "mediana_us": round(statistics.median(tiempos) * 1e6, 2),
+        "p99_us": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.99))] * 1e6, 2),
+    }
+
+
+def medir_memoria(fn, usuario) -> dict:
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        fn(usuario)
+        _, pico = tracemalloc.get_traced_memory()
+        despues = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diferencias = despues.compare_to(antes, "filename")
+    return {
+        "pico_kb": round(pico / 1024, 2),
+        "bloques_asignados": sum(max(d.count_diff, 0) for d in diferencias),
+    }
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def ejecutar(escalas, presupuesto_s: float) -> dict:
+    now = datetime(2025, 6, 1)
+    resultados = []
+    for num_cuentas, pagos_por_cuenta in escalas:
+        usuario = generar_empresa(num_cuentas, pagos_por_cuenta)
+        historial = usuario["historial_crediticio"]
+        num_pagos = sum(
+            len(linea["historial_pagos"])
+            for linea in historial["cuentas_credito"] + historial["credito_proveedores"]
+        )
+        for nombre, fn in funciones(now).items():
+            resultado = {
+                "funcion": nombre,
+                "cuentas": num_cuentas,
+                "pagos": num_pagos,
+                **medir_latencia(fn, usuario, presupuesto_s),
+                **medir_memoria(fn, usuario),
+            }
+            print(json.dumps(resultado))
+            resultados.append(resultado)
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+
+
+def comparar(actual: dict, referencia: dict, tolerancia: float) -> list:
+    base = {(r["funcion"], r["cuentas"]): r for r in referencia["resultados"]}
+    regresiones = []
+    for r in actual["resultados"]:
+        anterior = base.get((r["funcion"], r["cuentas"]))
+        if not anterior or not anterior["mediana_us"]:
+            continue
+        ratio = r["mediana_us"] / anterior["mediana_us"]
+        if ratio > 1 + tolerancia:
+            regresiones.append({
+                "funcion": r["funcion"],
+                "cuentas": r["cuentas"],
+                "antes_us": anterior["mediana_us"],
+                "ahora_us": r["mediana_us"],
+                "ratio": round(ratio, 2),
+            })
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de score_calculator")
+    parser.add_argument("--max-cuentas", type=int, default=10000, help="Omite las escalas con más cuentas")
+    parser.add_argument("--presupuesto", type=float, default=0.5, help="Segundos de medición por función y escala")
+    parser.add_argument("--salida", help="Fichero JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="Resultados JSON de referencia para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Ralentización admitida (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    escalas = [escala for escala in ESCALAS if escala[0] <= args.max_cuentas]
+    resultado = ejecutar(escalas, args.presupuesto)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            regresiones = comparar(resultado, json.load(f), args.tolerancia)
+        print(json.dumps({"regresiones": regresiones}, indent=2))
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
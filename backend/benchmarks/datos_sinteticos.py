@@ -0,0 +1,129 @@
+"""
+Generador de empresas sintéticas con el esquema de models.py.
+
+Produce diccionarios con la forma de los documentos de la colección users
+(InformacionGeneral, HistorialCrediticio con CuentaCredito, CreditoProveedor,
+HistorialPago y SolicitudCredito) para benchmarks y comparaciones. Las
+fechas se normalizan igual que al escribir en la base de datos.
+"""
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import date_normalization
+
+SECTORES = ["Tecnología", "Retail", "Servicios", "Manufactura", "Construcción", "Salud", "Agricultura"]
+PAISES = ["México", "Colombia", "Chile", "Perú", "Argentina", "España"]
+TAMANOS = ["Grande", "Mediana", "Pequeña", "Micro"]
+TIPOS_CREDITO = ["Préstamo", "Línea de crédito", "Tarjeta de crédito", "Leasing", "Hipoteca", "Factoraje"]
+ENTIDADES = ["Banco Nacional", "Financiera Central", "Banco del Pacífico", "Caja Rural", "Auto Finance"]
+ESTADOS_PAGO = ["Pagado", "Pagado", "Pagado", "Pagado", "Pagado", "Atrasado"]
+ESTADOS_SOLICITUD = ["Aprobada", "Rechazada", "En revisión"]
+
+HOY = date(2025, 6, 1)
+
+
+def _fecha(rng: random.Random, max_dias_atras: int) -> str:
+    return (HOY - timedelta(days=rng.randint(0, max_dias_atras))).isoformat()
+
+
+def historial_pagos(rng: random.Random, num_pagos: int) -> List[Dict]:
+    return [
+        {"fecha": _fecha(rng, 3650), "monto": rng.randint(100, 50000), "estado": rng.choice(ESTADOS_PAGO)}
+        for _ in range(num_pagos)
+    ]
+
+
+def cuenta_credito(rng: random.Random, idx: int, num_pagos: int) -> Dict:
+    limite = rng.randint(10000, 1000000)
+    return {
+        "id": f"CC{idx:05d}",
+        "tipo": rng.choice(TIPOS_CREDITO),
+        "entidad": rng.choice(ENTIDADES),
+        "fecha_apertura": _fecha(rng, 5000),
+        "monto_original": limite,
+        "saldo_actual": rng.randint(0, limite),
+        "limite_credito": limite,
+        "tasa_interes": round(rng.uniform(5, 30), 2),
+        "plazo_meses": rng.choice([12, 24, 36, 60]),
+        "estado": "Activo",
+        "historial_pagos": historial_pagos(rng, num_pagos),
+    }
+
+
+def credito_proveedor(rng: random.Random, idx: int, num_pagos: int) -> Dict:
+    limite = rng.randint(5000, 200000)
+    return {
+        "id": f"CP{idx:05d}",
+        "proveedor": f"Proveedor {idx}",
+        "terminos_pago": rng.choice(["30 días", "60 días", "90 días"]),
+        "limite_credito": limite,
+        "saldo_actual": rng.randint(0, limite),
+        "historial_pagos": historial_pagos(rng, num_pagos),
+    }
+
+
+def empresa(
+    rng: random.Random,
+    idx: int,
+    num_cuentas: int = 3,
+    num_proveedores: int = 2,
+    pagos_por_cuenta: int = 12,
+    num_solicitudes: int = 2,
+) -> Dict:
+    """Genera una empresa con el número indicado de cuentas, proveedores y pagos."""
+    return {
+        "username": f"empresa{idx}",
+        "informacion_general": {
+            "nombre_empresa": f"Empresa {idx} S.A.",
+            "nit": f"{900000000 + idx}",
+            "direccion": "Calle Falsa 123",
+            "telefono": "+52 55 0000 0000",
+            "correo": f"contacto@empresa{idx}.com",
+            "sitio_web": f"https://empresa{idx}.com",
+            "fecha_fundacion": _fecha(rng, 365 * 30),
+            "sector": rng.choice(SECTORES),
+            "tamano_empresa": rng.choice(TAMANOS),
+            "numero_empleados": rng.randint(1, 500),
+            "representante_legal": "Representante Legal",
+            "pais": rng.choice(PAISES),
+        },
+        "historial_crediticio": {
+            "cuentas_credito": [cuenta_credito(rng, k, pagos_por_cuenta) for k in range(num_cuentas)],
+            "credito_proveedores": [credito_proveedor(rng, k, pagos_por_cuenta) for k in range(num_proveedores)],
+            "solicitudes_credito_recientes": [
+                {
+                    "fecha": _fecha(rng, 730),
+                    "entidad": rng.choice(ENTIDADES),
+                    "tipo": rng.choice(TIPOS_CREDITO),
+                    "monto": rng.randint(10000, 500000),
+                    "estado": rng.choice(ESTADOS_SOLICITUD),
+                }
+                for _ in range(num_solicitudes)
+            ],
+            "incidentes_crediticios": [],
+        },
+    }
+
+
+def cartera(num_empresas: int, seed: Optional[int] = 42, **kwargs) -> List[Dict]:
+    """
+    Genera una cartera de empresas. Una de cada diez no tiene historial
+    crediticio, para cubrir también la rama de puntuación simulada.
+    """
+    rng = random.Random(seed)
+    empresas = []
+    for idx in range(num_empresas):
+        if idx % 10 == 9:
+            empresas.append(empresa(rng, idx, num_cuentas=0, num_proveedores=0, num_solicitudes=0))
+        else:
+            empresas.append(empresa(
+                rng, idx,
+                num_cuentas=kwargs.get("num_cuentas", rng.randint(1, 5)),
+                num_proveedores=kwargs.get("num_proveedores", rng.randint(0, 3)),
+                pagos_por_cuenta=kwargs.get("pagos_por_cuenta", rng.randint(0, 24)),
+                num_solicitudes=kwargs.get("num_solicitudes", rng.randint(0, 5)),
+            ))
+    for documento in empresas:
+        date_normalization.normalize_document(documento)
+    return empresas
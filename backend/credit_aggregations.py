@@ -0,0 +1,172 @@
+"""
+Métricas crediticias calculadas en MongoDB con pipelines de agregación.
+
+Los recuentos de pagos (historial de pagos) y las sumas de saldos y límites
+(utilización) son agregados simples sobre los arrays embebidos de
+historial_crediticio, así que se pueden calcular en el servidor sin traer los
+documentos completos a Python. Cada empresa se resume con expresiones de
+array ($reduce, $filter, $map) en una etapa $project, y las carteras se
+agregan con $group.
+
+Los resultados coinciden con los de calculate_payment_history_score y
+calculate_credit_utilization_score; compare_with_python() lo comprueba sobre
+una muestra de la colección:
+
+    python credit_aggregations.py --limite 1000
+"""
+import argparse
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+import database
+import score_calculator
+import scorecard
+
+_CUENTAS = {"$ifNull": ["$historial_crediticio.cuentas_credito", []]}
+_PROVEEDORES = {"$ifNull": ["$historial_crediticio.credito_proveedores", []]}
+_CUENTAS_Y_PROVEEDORES = {"$concatArrays": [_CUENTAS, _PROVEEDORES]}
+
+_PAGOS = {
+    "$reduce": {
+        "input": _CUENTAS_Y_PROVEEDORES,
+        "initialValue": [],
+        "in": {"$concatArrays": ["$$value", {"$ifNull": ["$$this.historial_pagos", []]}]}
+    }
+}
+
+# Igual que "atrasado" in pago.get("estado", "").lower()
+_ES_ATRASADO = {
+    "$gte": [{"$indexOfCP": [{"$toLower": {"$ifNull": ["$$pago.estado", ""]}}, "atrasado"]}, 0]
+}
+
+
+def _sum_field(field: str) -> Dict:
+    return {"$sum": {"$map": {"input": _CUENTAS_Y_PROVEEDORES, "in": {"$ifNull": [f"$$this.{field}", 0]}}}}
+
+
+METRICS_PROJECTION = {
+    "_id": 1,
+    "username": 1,
+    "total_payments": {"$size": _PAGOS},
+    "late_payments": {"$size": {"$filter": {"input": _PAGOS, "as": "pago", "cond": _ES_ATRASADO}}},
+    "total_debt": _sum_field("saldo_actual"),
+    "total_available": _sum_field("limite_credito"),
+}
+
+
+def company_metrics_pipeline(match: Optional[Dict] = None) -> List[Dict]:
+    """Una fila por empresa con sus recuentos de pagos y sus sumas de saldos y límites."""
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$project": METRICS_PROJECTION})
+    return pipeline
+
+
+def portfolio_summary_pipeline(match: Optional[Dict] = None, group_by: Optional[str] = None) -> List[Dict]:
+    """Totales de la cartera filtrada, opcionalmente agrupados por un campo (p. ej. el sector)."""
+    pipeline = company_metrics_pipeline(match)
+    if group_by:
+        # El campo de agrupación no sobrevive a la proyección: se añade antes
+        pipeline[-1] = {"$project": {**METRICS_PROJECTION, "grupo": f"${group_by}"}}
+    pipeline.append({
+        "$group": {
+            "_id": "$grupo" if group_by else None,
+            "companies": {"$sum": 1},
+            "total_payments": {"$sum": "$total_payments"},
+            "late_payments": {"$sum": "$late_payments"},
+            "total_debt": {"$sum": "$total_debt"},
+            "total_available": {"$sum": "$total_available"},
+        }
+    })
+    pipeline.append({
+        "$addFields": {
+            "on_time_percentage": {"$cond": [
+                {"$gt": ["$total_payments", 0]},
+                {"$multiply": [{"$divide": [{"$subtract": ["$total_payments", "$late_payments"]}, "$total_payments"]}, 100]},
+                None
+            ]},
+            "utilization": {"$cond": [
+                {"$ne": ["$total_available", 0]},
+                {"$multiply": [{"$divide": ["$total_debt", "$total_available"]}, 100]},
+                None
+            ]},
+        }
+    })
+    pipeline.append({"$sort": {"_id": 1}})
+    return pipeline
+
+
+def score_components(metrics: Dict, version: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Convierte las métricas de una empresa en los componentes payment_history y
+    credit_utilization, con las mismas bandas que score_calculator.
+    """
+    card = scorecard.get_scorecard(version)
+    return {
+        "payment_history": card.payment_history(metrics["total_payments"], metrics["late_payments"]),
+        "credit_utilization": card.credit_utilization(metrics["total_debt"], metrics["total_available"]),
+    }
+
+
+async def iter_company_metrics(match: Optional[Dict] = None, batch_size: int = 500) -> AsyncIterator[Dict]:
+    cursor = database.get_collection("users").aggregate(company_metrics_pipeline(match), batchSize=batch_size)
+    async for row in cursor:
+        yield row
+
+
+async def company_metrics(username: str, version: Optional[str] = None) -> Optional[Dict]:
+    """Métricas y componentes de una sola empresa."""
+    async for row in iter_company_metrics({"username": username}):
+        row["components"] = score_components(row, version)
+        return row
+    return None
+
+
+async def portfolio_summary(match: Optional[Dict] = None, group_by: Optional[str] = None) -> List[Dict]:
+    cursor = database.get_collection("users").aggregate(portfolio_summary_pipeline(match, group_by))
+    return [row async for row in cursor]
+
+
+async def compare_with_python(match: Optional[Dict] = None, limit: int = 1000) -> Dict:
+    """
+    Compara las métricas del pipeline con las de score_calculator sobre
+    las primeras `limit` empresas que cumplen el filtro.
+    """
+    collection = database.get_collection("users")
+    pipeline = company_metrics_pipeline(match) + [{"$sort": {"_id": 1}}, {"$limit": limit}]
+    expected_query = match or {}
+
+    checked = 0
+    mismatches = []
+    pushed = {row["_id"]: row async for row in collection.aggregate(pipeline)}
+    async for usuario in collection.find(
+        {"$and": [expected_query, {"_id": {"$in": list(pushed)}}]},
+        {"username": 1, "historial_crediticio": 1}
+    ):
+        historial = usuario.get("historial_crediticio", {})
+        expected = {
+            "payment_history": score_calculator.calculate_payment_history_score(historial),
+            "credit_utilization": score_calculator.calculate_credit_utilization_score(historial),
+        }
+        obtained = score_components(pushed[usuario["_id"]])
+        checked += 1
+        if expected != obtained:
+            mismatches.append(usuario.get("username"))
+
+    return {"checked": checked, "mismatches": len(mismatches), "usernames": mismatches[:50]}
+
+
+async def _main(args):
+    database.init_client()
+    try:
+        print(json.dumps(await compare_with_python(limit=args.limite)))
+    finally:
+        database.close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Valida las agregaciones frente a score_calculator")
+    parser.add_argument("--limite", type=int, default=1000)
+    asyncio.run(_main(parser.parse_args()))
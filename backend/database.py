@@ -0,0 +1,206 @@
+"""
+Pool de conexiones MongoDB compartido por toda la aplicación.
+
+El cliente se crea una sola vez por proceso, dentro del lifespan de FastAPI
+(es decir, después del fork de uvicorn/gunicorn), y todos los módulos lo
+obtienen mediante get_db() / get_collection() en lugar de crear su propio
+MongoClient al importarse.
+
+Variables de entorno:
+    MONGO_URI                          URI de conexión
+    MONGO_DB_NAME                      Base de datos (por defecto "pyme360")
+    MONGO_MAX_POOL_SIZE                Conexiones máximas del pool (por defecto 100)
+    MONGO_MIN_POOL_SIZE                Conexiones mínimas del pool (por defecto 0)
+    MONGO_MAX_IDLE_TIME_MS             Tiempo máximo de una conexión ociosa
+    MONGO_WAIT_QUEUE_TIMEOUT_MS        Espera máxima para obtener una conexión
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  Espera máxima para seleccionar servidor
+    MONGO_CONNECT_TIMEOUT_MS           Timeout de conexión
+    MONGO_SOCKET_TIMEOUT_MS            Timeout de lectura/escritura
+    MONGO_COMPRESSORS                  Lista separada por comas (zstd,snappy,zlib)
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import monitoring
+
+load_dotenv()
+
+DB_NAME = os.getenv("MONGO_DB_NAME", "pyme360")
+
+# Opciones del pool configurables por entorno: variable -> opción de PyMongo
+_INT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+}
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Recoge estadísticas del pool de conexiones para poder dimensionarlo:
+    conexiones abiertas, conexiones en uso y tiempo de espera en la cola.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open_connections = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.pools_cleared = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pools_cleared": self.pools_cleared,
+                "wait_queue_ms_avg": round(self.wait_time_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_queue_ms_max": round(self.wait_time_max * 1000, 3),
+            }
+
+    def _wait_time(self, event) -> float:
+        # PyMongo >= 4.9 incluye la duración en el evento; en versiones
+        # anteriores se mide desde el inicio del checkout en el mismo hilo
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration
+        started = getattr(self._local, "checkout_started", None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = self._wait_time(event)
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(0, self.open_connections - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+pool_stats = PoolStatsListener()
+
+_client: Optional[AsyncIOMotorClient] = None
+_client_pid: Optional[int] = None
+
+
+def get_client_options() -> Dict:
+    """Construye las opciones del cliente a partir de las variables de entorno."""
+    options = {}
+    for env_var, option in _INT_OPTIONS.items():
+        value = os.getenv(env_var)
+        if value:
+            options[option] = int(value)
+
+    compressors = os.getenv("MONGO_COMPRESSORS")
+    if compressors:
+        options["compressors"] = compressors
+
+    return options
+
+
+def init_client() -> AsyncIOMotorClient:
+    """Crea el cliente compartido. Se llama desde el lifespan de la app."""
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    # Un cliente heredado de un fork no es reutilizable: se crea uno nuevo
+    pool_stats.reset()
+    _client = AsyncIOMotorClient(
+        os.getenv("MONGO_URI"),
+        event_listeners=[pool_stats],
+        **get_client_options()
+    )
+    _client_pid = os.getpid()
+    return _client
+
+
+def close_client():
+    """Cierra el cliente compartido y libera el pool."""
+    global _client, _client_pid
+    if _client is not None:
+        _client.close()
+    _client = None
+    _client_pid = None
+    pool_stats.reset()
+
+
+def get_client() -> AsyncIOMotorClient:
+    # Inicialización perezosa para scripts que no pasan por el lifespan
+    if _client is None or _client_pid != os.getpid():
+        return init_client()
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    return get_client()[DB_NAME]
+
+
+def get_collection(name: str) -> AsyncIOMotorCollection:
+    return get_db()[name]
+
+
+# Toda escritura en users marca el documento con este campo: cada worker lo
+# consulta para invalidar su caché de usuarios (ver auth.sync_user_cache)
+USERS_UPDATED_AT_FIELD = "updated_at"
+
+
+def users_update_stamp() -> Dict:
+    """Campos a añadir al $set (o al documento insertado) de una escritura en users."""
+    return {USERS_UPDATED_AT_FIELD: datetime.now(timezone.utc)}
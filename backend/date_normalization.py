@@ -0,0 +1,176 @@
+"""
+Normalización de fechas en escritura.
+
+Los modelos de entrada reciben las fechas como cadenas "YYYY-MM-DD". Antes de
+escribir en la colección users, las fechas que usa la puntuación crediticia
+se convierten una sola vez a fechas nativas de BSON (datetime), de modo que
+el cálculo de las puntuaciones no tenga que parsear cadenas en cada petición.
+Al devolver documentos por la API se vuelven a formatear como "YYYY-MM-DD".
+
+Para los documentos existentes:
+
+    python date_normalization.py
+
+La migración solo modifica un documento si los campos que reescribe siguen
+como los leyó; los que cambien entretanto se cuentan como "conflicts" y se
+recogen en la siguiente ejecución. Cada documento migrado se marca como
+escrito (database.users_update_stamp), así que los workers de la API lo
+retiran de su caché de usuarios en la siguiente sincronización
+(auth.sync_user_cache); entretanto pueden seguir viendo fechas como cadena
+(la puntuación las parsea al leerlas, ver scorecard.as_datetime).
+"""
+import asyncio
+import copy
+import logging
+from datetime import date, datetime
+from typing import Callable, Dict, List
+
+from pymongo import UpdateOne
+
+import database
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# Rutas (con notación de punto; las listas se recorren elemento a elemento)
+DATE_FIELDS = (
+    "informacion_general.fecha_fundacion",
+    "historial_crediticio.cuentas_credito.fecha_apertura",
+    "historial_crediticio.solicitudes_credito_recientes.fecha",
+)
+
+MIGRATION_BATCH_SIZE = 500
+
+
+def parse_date(value):
+    """Convierte una cadena "YYYY-MM-DD" a datetime; los valores no válidos se dejan igual."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, DATE_FORMAT)
+        except ValueError:
+            return value
+    return value
+
+
+def format_date(value):
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    return value
+
+
+def _apply(value, parts: List[str], convert: Callable):
+    if isinstance(value, list):
+        for item in value:
+            _apply(item, parts, convert)
+        return
+    if not isinstance(value, dict) or parts[0] not in value:
+        return
+    if len(parts) == 1:
+        value[parts[0]] = convert(value[parts[0]])
+    else:
+        _apply(value[parts[0]], parts[1:], convert)
+
+
+def normalize_document(document: Dict) -> Dict:
+    """Convierte (en el sitio) las fechas de un documento de usuario completo."""
+    for path in DATE_FIELDS:
+        _apply(document, path.split("."), parse_date)
+    return document
+
+
+def normalize_update(update: Dict) -> Dict:
+    """
+    Convierte (en el sitio) las fechas de un diccionario para $set, cuyas
+    claves pueden ser rutas con punto (p. ej. "historial_crediticio" o
+    "historial_crediticio.cuentas_credito.0").
+    """
+    for key, value in update.items():
+        # Los índices de array de la clave no cambian la ruta lógica del campo
+        key_path = ".".join(part for part in key.split(".") if not part.isdigit() and part != "$")
+        for path in DATE_FIELDS:
+            if key_path == path:
+                update[key] = parse_date(value)
+            elif path.startswith(key_path + "."):
+                _apply(value, path[len(key_path) + 1:].split("."), parse_date)
+    return update
+
+
+def dates_to_strings(document: Dict) -> Dict:
+    """Vuelve a formatear (en el sitio) las fechas normalizadas como "YYYY-MM-DD"."""
+    for path in DATE_FIELDS:
+        _apply(document, path.split("."), format_date)
+    return document
+
+
+async def migrate_users(batch_size: int = MIGRATION_BATCH_SIZE) -> Dict:
+    """Normaliza las fechas guardadas como cadena en los documentos existentes."""
+    collection = database.get_collection("users")
+    query = {"$or": [{path: {"$type": "string"}} for path in DATE_FIELDS]}
+    projection = {"informacion_general.fecha_fundacion": 1, "historial_crediticio": 1}
+
+    scanned = 0
+    matched = 0
+    modified = 0
+    operations = []
+
+    async def flush():
+        nonlocal matched, modified
+        result = await collection.bulk_write(operations, ordered=False)
+        matched += result.matched_count
+        modified += result.modified_count
+        operations.clear()
+
+    async for document in collection.find(query, projection, batch_size=batch_size):
+        scanned += 1
+        original = copy.deepcopy(document)
+        normalize_document(document)
+
+        # Cada campo se reescribe solo si conserva el valor leído: así no se
+        # pisa una escritura concurrente con el contenido de esta lectura
+        condition = {"_id": document["_id"]}
+        update = {}
+        fundacion = document.get("informacion_general", {}).get("fecha_fundacion")
+        if fundacion is not None:
+            path = "informacion_general.fecha_fundacion"
+            condition[path] = original["informacion_general"]["fecha_fundacion"]
+            update[path] = fundacion
+        historial = document.get("historial_crediticio", {})
+        for field in ("cuentas_credito", "solicitudes_credito_recientes"):
+            if field in historial:
+                path = f"historial_crediticio.{field}"
+                condition[path] = original["historial_crediticio"][field]
+                update[path] = historial[field]
+
+        operations.append(UpdateOne(condition, {"$set": {**update, **database.users_update_stamp()}}))
+        if len(operations) >= batch_size:
+            await flush()
+
+    if operations:
+        await flush()
+
+    conflicts = scanned - matched
+    logger.info(
+        "Migración de fechas: %d documentos revisados, %d modificados, %d con cambios concurrentes",
+        scanned, modified, conflicts
+    )
+    if conflicts:
+        logger.warning("Vuelve a ejecutar la migración para los %d documentos con conflictos", conflicts)
+    return {"scanned": scanned, "modified": modified, "conflicts": conflicts}
+
+
+async def _main():
+    database.init_client()
+    try:
+        print(await migrate_users())
+    finally:
+        database.close_client()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
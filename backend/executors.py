@@ -0,0 +1,113 @@
+"""
+Ejecutores acotados para trabajo de CPU que no debe bloquear el event loop.
+
+Cada BoundedExecutor tiene su propio pool de hilos (límite de concurrencia)
+y una cola máxima de tareas pendientes: cuando se supera, las nuevas tareas
+se rechazan con ExecutorSaturatedError en lugar de acumular latencia.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class ExecutorSaturatedError(Exception):
+    """La cola del ejecutor está llena."""
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        """
+        :param name: Nombre del ejecutor (prefijo de los hilos)
+        :param max_workers: Tareas ejecutándose a la vez
+        :param max_queue: Tareas esperando turno antes de empezar a rechazar
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.run_time_total = 0.0
+
+    def _record_start(self, enqueued_at: float) -> float:
+        started_at = time.perf_counter()
+        waited = started_at - enqueued_at
+        with self._lock:
+            self.started += 1
+            self.queue_time_total += waited
+            self.queue_time_max = max(self.queue_time_max, waited)
+        return started_at
+
+    def _task_done(self, future: Future):
+        # Se llama cuando la tarea termina en su hilo, o cuando se cancela
+        # antes de empezar: cancelar la espera no libera el hueco mientras
+        # el hilo sigue ejecutándose
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled():
+                self.cancelled += 1
+            else:
+                self.completed += 1
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Ejecuta fn(*args) en el pool y espera el resultado sin bloquear el loop."""
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturatedError(f"Ejecutor '{self.name}' saturado")
+            self.pending += 1
+            self.submitted += 1
+
+        enqueued_at = time.perf_counter()
+
+        def task():
+            started_at = self._record_start(enqueued_at)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.run_time_total += time.perf_counter() - started_at
+
+        try:
+            future = self._executor.submit(task)
+        except RuntimeError:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._task_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self.pending,
+                "queued": max(0, self.pending - self.max_workers),
+                "submitted": self.submitted,
+                "started": self.started,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+                "queue_ms_avg": round(self.queue_time_total / self.started * 1000, 3) if self.started else 0.0,
+                "queue_ms_max": round(self.queue_time_max * 1000, 3),
+                "run_ms_avg": round(self.run_time_total / self.completed * 1000, 3) if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def default_workers() -> int:
+    return min(4, os.cpu_count() or 1)
@@ -0,0 +1,90 @@
+"""
+Índices y colecciones especiales que necesita la aplicación.
+
+Cada colección declara aquí sus índices y ensure_indexes() los crea al
+arrancar (create_indexes es idempotente si el índice ya existe con la
+misma definición). Las colecciones de series temporales tienen que crearse
+explícitamente antes de recibir documentos: ensure_collections() lo hace.
+"""
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+import database
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # Búsqueda por usuario en cada petición autenticada y unicidad en el registro
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # Invalidación de la caché de usuarios de cada worker (auth.sync_user_cache)
+        IndexModel([("updated_at", ASCENDING)], name="updated_at", sparse=True),
+        # Sincronización incremental del índice de percentiles (peer_index.py)
+        IndexModel(
+            [("scores_materializados.updated_at", ASCENDING)], name="scores_updated_at", sparse=True
+        ),
+    ],
+    "revoked_tokens": [
+        # MongoDB borra cada revocación cuando el token expira
+        IndexModel([("exp", ASCENDING)], name="exp_ttl", expireAfterSeconds=0),
+        # Sincronización incremental entre workers
+        IndexModel([("revoked_at", ASCENDING)], name="revoked_at"),
+    ],
+    "score_history": [
+        # Consultas por rango de fechas del histórico de un usuario
+        IndexModel(
+            [("meta.username", ASCENDING), ("meta.kind", ASCENDING), ("ts", ASCENDING)],
+            name="username_kind_ts"
+        ),
+    ],
+}
+
+# Colecciones cuyos índices son imprescindibles: el registro confía en el
+# índice único de username para rechazar duplicados, así que sin él la app
+# no debe arrancar
+REQUIRED_INDEXES = {"users"}
+
+TIME_SERIES_COLLECTIONS: Dict[str, Dict] = {
+    "score_history": {"timeField": "ts", "metaField": "meta", "granularity": "hours"},
+}
+
+
+async def ensure_collections() -> List[str]:
+    """Crea las colecciones de series temporales que aún no existen."""
+    db = database.get_db()
+    existing = set(await db.list_collection_names())
+    created = []
+    for collection_name, timeseries in TIME_SERIES_COLLECTIONS.items():
+        if collection_name in existing:
+            continue
+        try:
+            await db.create_collection(collection_name, timeseries=timeseries)
+            created.append(collection_name)
+        except CollectionInvalid:
+            # Otro worker la ha creado a la vez
+            pass
+        except OperationFailure as e:
+            logger.error("Error creando la colección '%s': %s", collection_name, e)
+    return created
+
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """
+    Crea los índices declarados. Devuelve los nombres creados por colección.
+    Lanza RuntimeError si falla alguno de REQUIRED_INDEXES.
+    """
+    db = database.get_db()
+    created = {}
+    for collection_name, models in INDEXES.items():
+        try:
+            created[collection_name] = await db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # Por ejemplo, usuarios duplicados previos al índice único: hay que
+            # limpiar los datos a mano antes de poder arrancar
+            logger.error("Error creando índices en '%s': %s", collection_name, e)
+            if collection_name in REQUIRED_INDEXES:
+                raise RuntimeError(f"No se pudieron crear los índices de '{collection_name}'") from e
+    return created
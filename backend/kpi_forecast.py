@@ -0,0 +1,591 @@
+"""
+Motor de simulación Monte Carlo para la predicción de KPIs.
+
+En lugar de construir una única trayectoria mes a mes, simulate_paths()
+genera miles de trayectorias a la vez como una matriz trayectorias x meses:
+el crecimiento, la estacionalidad, los shocks de mercado y el ruido son
+operaciones sobre arrays, y el valor de cada mes es el producto acumulado
+(np.cumprod) de los factores. La proyección es la mediana de las
+trayectorias y los límites superior e inferior son percentiles reales entre
+ellas.
+
+Si la empresa tiene guardada la serie mensual del KPI (ventas, ingresos,
+margen o flujo de caja), las trayectorias parten de un modelo de suavizado
+exponencial ajustado sobre esa serie (kpi_models) en lugar de una tasa de
+crecimiento sectorial.
+
+Cada KPI usa su propio generador (np.random.Generator) sembrado a partir
+del usuario, el KPI, el periodo y la versión de los datos de entrada; los
+shocks y eventos de mercado, comunes a todos los KPIs, salen de un generador
+sembrado solo con el usuario y el periodo. Así la misma petición devuelve
+siempre los mismos valores, un KPI da lo mismo pedido solo o en lote, y el
+resultado se guarda en una caché acotada (forecast_cache) hasta que cambian
+los datos.
+
+El horizonte admite hasta MAX_HORIZON_MONTHS meses ("60m", "10y"...); las
+etiquetas empiezan siempre en el mes actual y, para horizontes largos, la
+respuesta puede agregarse por trimestre o por año. Si la serie guardada
+termina antes del mes actual, el modelo simula primero los meses que faltan
+y solo se devuelven los puntos desde el mes actual; una serie sin datos de
+los últimos MAX_SERIES_AGE_MONTHS meses no se usa.
+"""
+import hashlib
+import os
+import re
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import kpi_models
+from cache import TTLCache
+from executors import BoundedExecutor, default_workers
+
+KPI_MC_PATHS = int(os.getenv("KPI_MC_PATHS", "2000"))
+
+forecast_cache = TTLCache(
+    maxsize=int(os.getenv("KPI_FORECAST_CACHE_MAXSIZE", "4096")),
+    ttl=float(os.getenv("KPI_FORECAST_CACHE_TTL_SECONDS", "3600"))
+)
+
+# Una predicción sin caché son cientos de ms de NumPy: los endpoints la
+# ejecutan en este pool para no bloquear el event loop
+forecast_executor = BoundedExecutor(
+    "kpi-forecast",
+    max_workers=int(os.getenv("KPI_FORECAST_WORKERS", str(default_workers()))),
+    max_queue=int(os.getenv("KPI_FORECAST_MAX_QUEUE", "32"))
+)
+
+# Percentiles de la banda de confianza (intervalo del 80%)
+LOWER_PERCENTILE = 10
+UPPER_PERCENTILE = 90
+
+MAX_HORIZON_MONTHS = 120
+# Antigüedad máxima del último dato de una serie para usarla en la predicción
+MAX_SERIES_AGE_MONTHS = 24
+_PERIODO = re.compile(r"^\s*(\d+)\s*([my])\s*$", re.IGNORECASE)
+
+GRANULARIDADES = ("month", "quarter", "year")
+
+# Crecimiento anual por sector: (mínimo, máximo)
+TASAS_CRECIMIENTO = {
+    "Tecnología": (0.08, 0.15),
+    "Retail": (0.05, 0.12),
+    "Servicios": (0.06, 0.10),
+    "Manufactura": (0.04, 0.09),
+    "Construcción": (0.03, 0.08),
+    "Salud": (0.07, 0.14),
+}
+TASA_CRECIMIENTO_DEFECTO = (0.05, 0.10)
+
+MULTIPLICADORES_PAIS = {
+    "México": 1.0,
+    "Colombia": 1.1,
+    "Chile": 1.2,
+    "Perú": 0.9,
+    "Argentina": 0.85,
+    "España": 1.15
+}
+
+# Temporada alta en noviembre y diciembre, baja en enero y febrero
+FACTORES_ESTACIONALES = np.array([0.8, 0.8, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.2, 1.2])
+
+# 30% de probabilidad de evento de mercado cada mes, con impacto entre -10% y +10%
+PROBABILIDAD_SHOCK = 0.3
+RANGO_SHOCK = (0.9, 1.1)
+RANGO_RUIDO = (0.97, 1.03)
+
+FECHAS_BASE = ["ene", "feb", "mar", "abr", "may", "jun", "jul", "ago", "sept", "oct", "nov", "dic"]
+
+EVENTOS_POSIBLES = [
+    "Temporada alta",
+    "Desaceleración del mercado",
+    "Impulso pre-festividades",
+    "Expansión del sector",
+    "Cierre fiscal favorable",
+    "Nuevas regulaciones"
+]
+
+
+def horizon_months(period: str) -> int:
+    """Meses del horizonte: "36m" -> 36, "5y" -> 60 (máximo MAX_HORIZON_MONTHS)."""
+    match = _PERIODO.match(period or "")
+    if not match:
+        raise ValueError(f"Periodo no válido: {period}. Formato esperado: '<n>m' o '<n>y'")
+    meses = int(match.group(1)) * (12 if match.group(2).lower() == "y" else 1)
+    if not 1 <= meses <= MAX_HORIZON_MONTHS:
+        raise ValueError(f"El horizonte debe estar entre 1 y {MAX_HORIZON_MONTHS} meses")
+    return meses
+
+
+def month_calendar(start: date, meses: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Año y mes (0-11) de cada punto de la proyección; el punto 0 es el mes de start."""
+    indices = start.year * 12 + start.month - 1 + np.arange(meses + 1)
+    return indices // 12, indices % 12
+
+
+def month_labels(años: np.ndarray, meses: np.ndarray) -> List[str]:
+    return [f"{FECHAS_BASE[m]} {a}" for a, m in zip(años.tolist(), meses.tolist())]
+
+
+def aggregate(paths: np.ndarray, años: np.ndarray, meses: np.ndarray, granularity: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Media de las trayectorias por trimestre o año natural (los periodos
+    incompletos de los extremos promedian los meses que tienen) y etiquetas
+    de cada periodo.
+    """
+    if granularity == "quarter":
+        claves = años * 4 + meses // 3
+        etiquetas = [f"T{c % 4 + 1} {c // 4}" for c in claves.tolist()]
+    else:
+        claves = años
+        etiquetas = [str(c) for c in claves.tolist()]
+    inicios = np.flatnonzero(np.r_[True, claves[1:] != claves[:-1]])
+    tamaños = np.diff(np.r_[inicios, len(claves)])
+    agregadas = np.add.reduceat(paths, inicios, axis=1) / tamaños
+    return agregadas, [etiquetas[i] for i in inicios.tolist()]
+
+
+def seasonal_factors(meses: int, start_month: int = 1) -> np.ndarray:
+    """Factor estacional de cada mes simulado (el mes 0 es start_month)."""
+    return FACTORES_ESTACIONALES[(np.arange(meses + 1) + start_month - 1) % 12]
+
+
+def market_shocks(rng: np.random.Generator, num_paths: int, meses: int) -> np.ndarray:
+    """Factores multiplicativos (num_paths, meses) de los eventos de mercado; 1.0 sin evento."""
+    hay_shock = rng.random((num_paths, meses)) < PROBABILIDAD_SHOCK
+    return np.where(hay_shock, rng.uniform(*RANGO_SHOCK, size=(num_paths, meses)), 1.0)
+
+
+def simulate_growth(
+    valor_inicial: float,
+    tasas_mensuales: np.ndarray,
+    meses: int,
+    rng: Union[np.random.Generator, Sequence[np.random.Generator]],
+    num_paths: int = KPI_MC_PATHS,
+    estacionalidad: Optional[np.ndarray] = None,
+    shocks: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Trayectorias de varias tasas de crecimiento a la vez: devuelve una
+    matriz (tasas, num_paths, meses + 1). La estacionalidad y los shocks de
+    mercado (num_paths, meses) son comunes a todas las tasas; rng puede ser
+    un generador por tasa.
+    """
+    crecimiento = np.empty((len(tasas_mensuales), num_paths, meses))
+    crecimiento[:] = (1 + np.asarray(tasas_mensuales))[:, None, None]
+    if estacionalidad is not None:
+        crecimiento *= estacionalidad[1:]
+    if shocks is not None:
+        crecimiento *= shocks
+    rngs = [rng] * len(crecimiento) if isinstance(rng, np.random.Generator) else rng
+    for fila, rng_tasa in zip(crecimiento, rngs):
+        fila *= rng_tasa.uniform(*RANGO_RUIDO, size=fila.shape)
+
+    paths = np.empty((len(tasas_mensuales), num_paths, meses + 1))
+    paths[:, :, 0] = valor_inicial
+    np.cumprod(crecimiento, axis=2, out=paths[:, :, 1:])
+    paths[:, :, 1:] *= valor_inicial
+    return paths
+
+
+def simulate_paths(
+    valor_inicial: float,
+    tasa_mensual: float,
+    meses: int,
+    rng: np.random.Generator,
+    num_paths: int = KPI_MC_PATHS,
+    estacionalidad: Optional[np.ndarray] = None,
+    shocks_mercado: bool = False
+) -> np.ndarray:
+    """
+    Devuelve una matriz (num_paths, meses + 1) con las trayectorias
+    simuladas; la primera columna es el valor inicial.
+    """
+    shocks = market_shocks(rng, num_paths, meses) if shocks_mercado else None
+    return simulate_growth(valor_inicial, np.array([tasa_mensual]), meses, rng, num_paths, estacionalidad, shocks)[0]
+
+
+def annualized_volatility(paths: np.ndarray) -> float:
+    """
+    Volatilidad anualizada (en %): dispersión entre trayectorias de los
+    rendimientos de cada mes, sin la parte determinista (tendencia y
+    estacionalidad), que es igual en todas. Las series que pueden ser cero o
+    negativas (margen, flujo de caja) usan variaciones relativas al valor
+    absoluto del mes anterior.
+    """
+    if np.all(paths > 0):
+        rendimientos = np.diff(np.log(paths), axis=1)
+    else:
+        anterior = np.abs(paths[:, :-1])
+        rendimientos = np.divide(np.diff(paths, axis=1), anterior, out=np.zeros_like(anterior), where=anterior > 0)
+    return float(np.std(rendimientos, axis=0).mean() * np.sqrt(12) * 100)
+
+
+def _variaciones(valores: np.ndarray) -> np.ndarray:
+    """Variación porcentual de cada mes respecto al anterior (0 si el anterior es 0)."""
+    anterior = np.abs(valores[:-1])
+    return np.divide(np.diff(valores), anterior, out=np.zeros_like(anterior), where=anterior > 0) * 100
+
+
+def _crecimiento(valor_inicial: float, valor_final: float, meses: int):
+    """Crecimiento total y mensual compuesto, en %."""
+    if valor_inicial == 0:
+        return 0.0, 0.0
+    crecimiento_total = (valor_final - valor_inicial) / abs(valor_inicial) * 100
+    if valor_inicial > 0 and valor_final > 0:
+        crecimiento_mensual = ((valor_final / valor_inicial) ** (1 / meses) - 1) * 100
+    else:
+        crecimiento_mensual = crecimiento_total / meses
+    return crecimiento_total, crecimiento_mensual
+
+
+def _recomendacion(crecimiento_total: float, volatilidad: float) -> str:
+    if crecimiento_total > 50:
+        recomendacion = "Basado en tu proyección de ingresos, es recomendable preparar tu operación para escalar rápidamente. Considera invertir en capacidad adicional y optimizar procesos para mantener la calidad durante este fuerte crecimiento."
+    elif crecimiento_total > 20:
+        recomendacion = "Tu negocio muestra un crecimiento sólido. Recomendamos reforzar tus procesos operativos y comenzar a planificar la siguiente fase de expansión para aprovechar esta tendencia positiva."
+    else:
+        recomendacion = "Tu proyección muestra un crecimiento moderado. Enfócate en optimizar costos y mejorar márgenes, mientras exploras nuevas oportunidades de mercado para acelerar el crecimiento."
+
+    # Añadir recomendación sobre volatilidad
+    if volatilidad > 10:
+        recomendacion += " La tendencia histórica volátil sugiere preparar planes de contingencia para diferentes escenarios. Mantén reservas operativas y financieras para adaptarte a cambios bruscos."
+    else:
+        recomendacion += " Tu negocio muestra una tendencia estable, lo que facilita la planificación a largo plazo. Aprovecha esta estabilidad para realizar inversiones estratégicas con mayor confianza."
+    return recomendacion
+
+
+def _round_list(values: np.ndarray) -> List[float]:
+    return np.round(values, 2).tolist()
+
+
+def _respuesta(
+    kpi_type: str,
+    paths: np.ndarray,
+    cuantiles: np.ndarray,
+    inicio: date,
+    eventos: Tuple[np.ndarray, np.ndarray],
+    modelo: Optional["kpi_models.FittedModel"],
+    factores: Dict,
+    show_confidence_interval: bool,
+    granularity: str
+) -> Dict:
+    """
+    Respuesta de /api/kpi-prediction a partir de las trayectorias de un KPI y
+    de sus percentiles mensuales (inferior, mediana, superior).
+    """
+    periodo_meses = paths.shape[1] - 1
+    años, meses = month_calendar(inicio, periodo_meses)
+    etiquetas_meses = month_labels(años, meses)
+
+    mediana = cuantiles[1]
+    valor_inicial = round(float(mediana[0]), 2)
+    valor_final = round(float(mediana[-1]), 2)
+    crecimiento_total, crecimiento_mensual = _crecimiento(valor_inicial, valor_final, periodo_meses)
+
+    meses_evento, descripciones = eventos
+    eventos_mercado = [
+        {"mes": FECHAS_BASE[meses[i]], "año": int(años[i]), "descripcion": EVENTOS_POSIBLES[d]}
+        for i, d in zip(meses_evento.tolist(), descripciones.tolist())
+    ]
+
+    # Mes de mayor y menor crecimiento de la proyección
+    incrementos = _variaciones(mediana)
+    mejor, peor = int(np.argmax(incrementos)), int(np.argmin(incrementos))
+
+    volatilidad = round(annualized_volatility(paths), 2)
+
+    etiquetas = etiquetas_meses
+    if granularity != "month":
+        agregadas, etiquetas = aggregate(paths, años, meses, granularity)
+        cuantiles = np.percentile(agregadas, [LOWER_PERCENTILE, 50, UPPER_PERCENTILE], axis=0)
+    inferior, mediana, superior = cuantiles
+    valores_mensuales = _round_list(mediana)
+
+    if show_confidence_interval:
+        valores_superior = _round_list(superior)
+        valores_inferior = _round_list(inferior)
+    else:
+        valores_superior = valores_mensuales
+        valores_inferior = valores_mensuales
+
+    return {
+        "kpi_type": kpi_type,
+        "initial_value": valor_inicial,
+        "final_value": valor_final,
+        "monthly_values": valores_mensuales,
+        "upper_limit": valores_superior,
+        "lower_limit": valores_inferior,
+        "total_growth_percentage": round(crecimiento_total, 2),
+        "monthly_growth_percentage": round(crecimiento_mensual, 2),
+        "volatility": volatilidad,
+        "month_labels": etiquetas,
+        "granularity": granularity,
+        "horizon_months": periodo_meses,
+        "market_events": eventos_mercado,
+        "best_month": {
+            "month": etiquetas_meses[mejor + 1],
+            "growth": round(float(incrementos[mejor]), 2)
+        },
+        "worst_month": {
+            "month": etiquetas_meses[peor + 1],
+            "growth": round(float(incrementos[peor]), 2)
+        },
+        "factors": factores,
+        "recommendation": _recomendacion(crecimiento_total, volatilidad),
+        "confidence": "alta" if modelo is not None and modelo.kind == "holt_winters" else "moderada",
+        "simulated_paths": paths.shape[0],
+        "model": modelo.describe() if modelo is not None else {"type": "sector_growth"}
+    }
+
+
+def forecast_many(
+    usuario: Dict,
+    kpi_types: List[str],
+    period: str,
+    include_seasonality: bool = False,
+    include_market_factors: bool = False,
+    show_confidence_interval: bool = True,
+    rng: Optional[np.random.Generator] = None,
+    num_paths: int = KPI_MC_PATHS,
+    granularity: str = "month",
+    today: Optional[date] = None,
+    kpi_rngs: Optional[Dict[str, np.random.Generator]] = None
+) -> List[Dict]:
+    """
+    Predicción de varios KPIs en una sola pasada: los shocks de mercado, los
+    eventos y la estacionalidad se generan una vez con rng y son comunes a
+    todos; los KPIs con serie guardada se simulan juntos
+    (kpi_models.simulate_many) y los demás como un único array de tasas de
+    crecimiento (simulate_growth). Lo propio de cada KPI (errores del modelo,
+    tasa y ruido) sale de kpi_rngs[kpi_type] si se da, o de rng.
+    """
+    if granularity not in GRANULARIDADES:
+        raise ValueError(f"Granularidad no válida: {granularity}. Opciones: {', '.join(GRANULARIDADES)}")
+    periodo_meses = horizon_months(period)
+    rng = rng if rng is not None else np.random.default_rng()
+    kpi_rngs = kpi_rngs or {}
+    today = today or date.today()
+    kpi_types = list(dict.fromkeys(kpi_types))
+
+    info_general = usuario.get("informacion_general", {})
+    sector = info_general.get("sector", "Tecnología")
+    pais = info_general.get("pais", "México")
+    factores = {
+        "seasonality": include_seasonality,
+        "market_factors": include_market_factors,
+        "country": pais,
+        "sector": sector
+    }
+
+    inicio = today.replace(day=1)
+    modelos = {}
+    meses_sin_datos = {}
+    for kpi_type in kpi_types:
+        utilizable = usable_series(usuario, kpi_type, today)
+        if utilizable is not None:
+            serie, meses_sin_datos[kpi_type] = utilizable
+            modelos[kpi_type] = kpi_models.get_model(usuario.get("username"), kpi_type, *serie)
+
+    shocks = market_shocks(rng, num_paths, periodo_meses) if include_market_factors else None
+
+    # Entre 2 y 4 eventos de mercado, en meses distintos del horizonte
+    num_eventos = min(int(rng.integers(2, 5)), periodo_meses)
+    descripciones = rng.choice(len(EVENTOS_POSIBLES), num_eventos, replace=False)
+    meses_evento = np.sort(rng.choice(np.arange(1, periodo_meses + 1), num_eventos, replace=False))
+    eventos = (meses_evento, descripciones)
+
+    ingresos_base = usuario.get("finanzas", {}).get("ingresos_anuales")
+    if ingresos_base is None:
+        ingresos_base = int(rng.integers(8000, 15001))
+
+    paths = {}
+    con_modelo = [kpi_type for kpi_type in kpi_types if kpi_type in modelos]
+    if con_modelo:
+        simuladas = kpi_models.simulate_many(
+            [modelos[kpi_type] for kpi_type in con_modelo], periodo_meses,
+            [kpi_rngs.get(kpi_type, rng) for kpi_type in con_modelo], num_paths,
+            use_seasonality=include_seasonality, shocks=shocks,
+            lead=[meses_sin_datos[kpi_type] for kpi_type in con_modelo]
+        )
+        for kpi_type, trayectorias in zip(con_modelo, simuladas):
+            paths[kpi_type] = trayectorias
+
+    sin_modelo = [kpi_type for kpi_type in kpi_types if kpi_type not in modelos]
+    if sin_modelo:
+        rngs = [kpi_rngs.get(kpi_type, rng) for kpi_type in sin_modelo]
+        rango = TASAS_CRECIMIENTO.get(sector, TASA_CRECIMIENTO_DEFECTO)
+        tasas = np.array([rng_kpi.uniform(*rango) for rng_kpi in rngs]) / 12
+        tasas *= MULTIPLICADORES_PAIS.get(pais, 1.0)
+
+        estacionalidad = seasonal_factors(periodo_meses, inicio.month) if include_seasonality else None
+        simuladas = simulate_growth(ingresos_base, tasas, periodo_meses, rngs, num_paths, estacionalidad, shocks)
+        for kpi_type, trayectorias in zip(sin_modelo, simuladas):
+            paths[kpi_type] = trayectorias
+
+    # Percentiles de todos los KPIs en una sola llamada: (3, kpis, meses + 1)
+    todas = np.stack([paths[kpi_type] for kpi_type in kpi_types])
+    cuantiles = np.percentile(todas, [LOWER_PERCENTILE, 50, UPPER_PERCENTILE], axis=1)
+
+    respuestas = [
+        _respuesta(
+            kpi_type, todas[i], cuantiles[:, i], inicio, eventos, modelos.get(kpi_type),
+            factores, show_confidence_interval, granularity
+        )
+        for i, kpi_type in enumerate(kpi_types)
+    ]
+    for respuesta in respuestas:
+        if respuesta["kpi_type"] in meses_sin_datos:
+            respuesta["model"]["months_extrapolated"] = meses_sin_datos[respuesta["kpi_type"]]
+    return respuestas
+
+
+def forecast(
+    usuario: Dict,
+    kpi_type: str,
+    period: str,
+    include_seasonality: bool = False,
+    include_market_factors: bool = False,
+    show_confidence_interval: bool = True,
+    rng: Optional[np.random.Generator] = None,
+    num_paths: int = KPI_MC_PATHS,
+    granularity: str = "month",
+    today: Optional[date] = None
+) -> Dict:
+    """Predicción de un KPI con la forma de respuesta de /api/kpi-prediction."""
+    return forecast_many(
+        usuario, [kpi_type], period,
+        include_seasonality=include_seasonality,
+        include_market_factors=include_market_factors,
+        show_confidence_interval=show_confidence_interval,
+        rng=rng,
+        num_paths=num_paths,
+        granularity=granularity,
+        today=today
+    )[0]
+
+
+def usable_series(usuario: Dict, kpi_type: str, today: date) -> Optional[Tuple[Tuple[List[str], np.ndarray], int]]:
+    """
+    Serie guardada del KPI si la predicción debe partir de ella, junto con
+    los meses sin datos hasta el mes actual; None si no hay serie o su último
+    dato tiene más de MAX_SERIES_AGE_MONTHS meses.
+    """
+    serie = kpi_models.extract_series(usuario, kpi_type)
+    if serie is None:
+        return None
+    ultimo_mes = serie[0][-1]
+    antiguedad = (today.year * 12 + today.month - 1) - (int(ultimo_mes[:4]) * 12 + int(ultimo_mes[5:7]) - 1)
+    if antiguedad > MAX_SERIES_AGE_MONTHS:
+        return None
+    return serie, max(antiguedad, 0)
+
+
+def input_version(usuario: Dict, kpi_type: str, today: Optional[date] = None) -> str:
+    """
+    Versión de los datos de los que depende la predicción: la serie guardada
+    (y la versión del ajuste del modelo) si se usa (ver usable_series) o los
+    datos generales.
+    """
+    utilizable = usable_series(usuario, kpi_type, today or date.today())
+    if utilizable is not None:
+        return f"{kpi_models.MODEL_VERSION}:{kpi_models.data_version(*utilizable[0])}"
+    info_general = usuario.get("informacion_general", {})
+    base = "|".join(str(valor) for valor in (
+        info_general.get("sector"),
+        info_general.get("pais"),
+        usuario.get("finanzas", {}).get("ingresos_anuales"),
+    ))
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
+
+
+def forecast_seed(username: Optional[str], kpi_type: str, period: str, version: str) -> int:
+    digest = hashlib.sha256(f"{username}|{kpi_type}|{period}|{version}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _market_seed(username: Optional[str], period: str) -> int:
+    """Semilla de los shocks y eventos de mercado, comunes a todos los KPIs del usuario."""
+    return forecast_seed(username, "*", period, "")
+
+
+def cached_forecast(
+    usuario: Dict,
+    kpi_type: str,
+    period: str,
+    include_seasonality: bool = False,
+    include_market_factors: bool = False,
+    show_confidence_interval: bool = True,
+    num_paths: int = KPI_MC_PATHS,
+    granularity: str = "month"
+) -> Dict:
+    """
+    Predicción reproducible: sembrada por usuario, KPI, periodo y versión de
+    los datos, y memoizada en forecast_cache (las etiquetas dependen del mes
+    actual, que también forma parte de la clave). El modelo es una función
+    pura de la serie (ver kpi_models), así que el resultado solo depende de
+    la clave: no de qué predicciones se calcularon antes en el proceso.
+    """
+    return cached_forecast_many(
+        usuario, [kpi_type], period,
+        include_seasonality=include_seasonality,
+        include_market_factors=include_market_factors,
+        show_confidence_interval=show_confidence_interval,
+        num_paths=num_paths,
+        granularity=granularity
+    )[0]
+
+
+def cached_forecast_many(
+    usuario: Dict,
+    kpi_types: List[str],
+    period: str,
+    include_seasonality: bool = False,
+    include_market_factors: bool = False,
+    show_confidence_interval: bool = True,
+    num_paths: int = KPI_MC_PATHS,
+    granularity: str = "month"
+) -> List[Dict]:
+    """
+    Versión por lotes de cached_forecast: cada KPI se siembra y se memoiza
+    por separado, igual que en cached_forecast, y los que no están en caché
+    se simulan juntos en una sola pasada de forecast_many.
+    """
+    username = usuario.get("username")
+    kpi_types = list(dict.fromkeys(kpi_types))
+    today = date.today()
+    versions = {kpi_type: input_version(usuario, kpi_type, today) for kpi_type in kpi_types}
+    keys = {
+        kpi_type: (username, kpi_type, period, include_seasonality, include_market_factors,
+                   show_confidence_interval, num_paths, granularity, versions[kpi_type], today.strftime("%Y-%m"))
+        for kpi_type in kpi_types
+    }
+    resultados = {}
+    for kpi_type in kpi_types:
+        cached = forecast_cache.get(keys[kpi_type])
+        if cached is not None:
+            resultados[kpi_type] = cached
+
+    pendientes = [kpi_type for kpi_type in kpi_types if kpi_type not in resultados]
+    if pendientes:
+        calculados = forecast_many(
+            usuario, pendientes, period,
+            include_seasonality=include_seasonality,
+            include_market_factors=include_market_factors,
+            show_confidence_interval=show_confidence_interval,
+            rng=np.random.default_rng(_market_seed(username, period)),
+            num_paths=num_paths,
+            granularity=granularity,
+            today=today,
+            kpi_rngs={
+                kpi_type: np.random.default_rng(forecast_seed(username, kpi_type, period, versions[kpi_type]))
+                for kpi_type in pendientes
+            }
+        )
+        for kpi_type, resultado in zip(pendientes, calculados):
+            resultado["data_version"] = versions[kpi_type]
+            resultados[kpi_type] = resultado
+            if username is not None:
+                forecast_cache.set(keys[kpi_type], resultado)
+    return [resultados[kpi_type] for kpi_type in kpi_types]
@@ -0,0 +1,273 @@
+"""
+Modelos de series temporales para la predicción de KPIs a partir de los
+datos mensuales guardados de la empresa (ventas_mensuales, margen_beneficio
+y flujo_caja).
+
+Se ajusta un suavizado exponencial de Holt-Winters aditivo (nivel, tendencia
+y estacionalidad de 12 meses) cuando hay al menos dos años de datos, o de
+Holt (nivel y tendencia) con series más cortas. Los parámetros se eligen por
+mínimo error cuadrático de las predicciones a un paso, evaluando toda la
+rejilla de parámetros a la vez con NumPy.
+
+La serie se lee sobre un calendario mensual continuo: los meses que faltan
+entre el primero y el último se interpolan linealmente, y los valores que no
+son números finitos (incluidos los booleanos) se descartan.
+
+El modelo es una función pura de la serie: cada versión nueva de los datos
+se ajusta desde cero con la búsqueda completa de parámetros, de modo que la
+misma serie da siempre el mismo modelo, sin depender de las series vistas
+antes. Los modelos ajustados se guardan en una caché por usuario y KPI junto
+con la serie usada (su versión de datos); si la serie no ha cambiado,
+predecir solo cuesta la simulación.
+"""
+import hashlib
+import math
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from cache import TTLCache
+
+# KPI -> (subdocumento con datos_mensuales, campo del valor)
+SERIES = {
+    "ingresos": ("margen_beneficio", "ingresos"),
+    "ventas": ("ventas_mensuales", "total"),
+    "margen": ("margen_beneficio", "margen_neto"),
+    "flujo_caja": ("flujo_caja", "saldo_final"),
+}
+
+# Proyección necesaria para leer todas las series
+SERIES_FIELDS = tuple(sorted({f"{documento}.datos_mensuales" for documento, _ in SERIES.values()}))
+
+SEASON_LENGTH = 12
+MIN_OBSERVATIONS = 4
+
+# Versión del procedimiento de ajuste: forma parte de la versión de los datos
+# de cada predicción (kpi_forecast.input_version), así que cambiarla al
+# modificar la rejilla o las ecuaciones invalida las predicciones memoizadas
+MODEL_VERSION = "hw-grid-2"
+
+_MES = re.compile(r"^(\d{4})-(\d{2})")
+
+_GRID = np.linspace(0.05, 0.95, 7)
+
+model_cache = TTLCache(
+    maxsize=int(os.getenv("KPI_MODEL_CACHE_MAXSIZE", "10000")),
+    ttl=float(os.getenv("KPI_MODEL_CACHE_TTL_SECONDS", "86400"))
+)
+
+
+def _month_index(mes) -> Optional[int]:
+    match = _MES.match(mes) if isinstance(mes, str) else None
+    if match is None or not 1 <= int(match.group(2)) <= 12:
+        return None
+    return int(match.group(1)) * 12 + int(match.group(2)) - 1
+
+
+def extract_series(usuario: Dict, kpi_type: str) -> Optional[Tuple[List[str], np.ndarray]]:
+    """
+    Serie mensual (meses "YYYY-MM" consecutivos y valores) del KPI, o None si
+    no hay datos suficientes. Los huecos se rellenan por interpolación lineal.
+    """
+    if kpi_type not in SERIES:
+        return None
+    documento, campo = SERIES[kpi_type]
+    datos = (usuario.get(documento) or {}).get("datos_mensuales") or []
+    por_mes = {}
+    for dato in datos:
+        valor = dato.get(campo)
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)) or not math.isfinite(valor):
+            continue
+        indice = _month_index(dato.get("mes"))
+        if indice is not None:
+            por_mes[indice] = float(valor)
+    if len(por_mes) < MIN_OBSERVATIONS:
+        return None
+
+    indices = np.array(sorted(por_mes))
+    valores = np.array([por_mes[i] for i in indices.tolist()], dtype=np.float64)
+    calendario = np.arange(indices[0], indices[-1] + 1)
+    if len(calendario) > len(indices):
+        valores = np.interp(calendario, indices, valores)
+    meses = [f"{i // 12:04d}-{i % 12 + 1:02d}" for i in calendario.tolist()]
+    return meses, valores
+
+
+def data_version(meses: List[str], valores: np.ndarray) -> str:
+    digest = hashlib.sha256("|".join(meses).encode("utf-8"))
+    digest.update(valores.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _initial_state(valores: np.ndarray, seasonal: bool) -> Tuple[float, float, np.ndarray]:
+    m = SEASON_LENGTH
+    if seasonal:
+        level = valores[:m].mean()
+        trend = (valores[m:2 * m].mean() - level) / m
+        season = valores[:m] - level
+    else:
+        level = valores[0]
+        trend = valores[1] - valores[0]
+        season = np.zeros(m)
+    return level, trend, season
+
+
+def _run(valores, level, trend, season, alpha, beta, gamma, start: int):
+    """
+    Aplica las ecuaciones de suavizado a `valores` para G combinaciones de
+    parámetros a la vez (level, trend, alpha... de forma (G,), season (G, m)).
+    Devuelve el estado final y la suma de errores cuadráticos a un paso.
+    """
+    m = season.shape[1]
+    sse = np.zeros(level.shape[0])
+    rows = np.arange(level.shape[0])
+    for t, y in enumerate(valores):
+        idx = (start + t) % m
+        s = season[:, idx]
+        error = y - (level + trend + s)
+        sse += error * error
+        new_level = level + trend + alpha * error
+        trend = trend + beta * (new_level - level - trend)
+        season[rows, idx] = s + gamma * (y - new_level - s)
+        level = new_level
+    return level, trend, season, sse
+
+
+class FittedModel:
+    def __init__(self, kind, alpha, beta, gamma, level, trend, season, sse, meses, valores):
+        self.kind = kind
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.level = level
+        self.trend = trend
+        self.season = season
+        self.sse = sse
+        self.meses = meses
+        self.valores = valores
+        self.data_version = data_version(meses, valores)
+
+    @property
+    def sigma(self) -> float:
+        return float(np.sqrt(self.sse / max(len(self.valores), 1)))
+
+    def simulate(self, horizonte: int, rng: np.random.Generator, num_paths: int,
+                 use_seasonality: bool = True, shocks: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Trayectorias (num_paths, horizonte + 1) propagando errores normales
+        por las ecuaciones del modelo; la primera columna es el último valor
+        observado.
+        """
+        return simulate_many([self], horizonte, rng, num_paths, use_seasonality, shocks)[0]
+
+    def describe(self) -> Dict:
+        return {
+            "type": self.kind,
+            "observations": len(self.valores),
+            "last_month": self.meses[-1],
+            "data_version": self.data_version,
+            "params": {
+                "alpha": round(self.alpha, 3),
+                "beta": round(self.beta, 3),
+                "gamma": round(self.gamma, 3),
+            },
+            "residual_std": round(self.sigma, 4),
+        }
+
+
+def fit(meses: List[str], valores: np.ndarray) -> FittedModel:
+    """Ajusta el modelo buscando los parámetros en la rejilla (todas las combinaciones a la vez)."""
+    seasonal = len(valores) >= 2 * SEASON_LENGTH
+    if seasonal:
+        alpha, beta, gamma = (g.ravel() for g in np.meshgrid(_GRID, _GRID, _GRID, indexing="ij"))
+        kind = "holt_winters"
+    else:
+        alpha, beta = (g.ravel() for g in np.meshgrid(_GRID, _GRID, indexing="ij"))
+        gamma = np.zeros_like(alpha)
+        kind = "holt"
+
+    level0, trend0, season0 = _initial_state(valores, seasonal)
+    combos = alpha.shape[0]
+    level, trend, season, sse = _run(
+        valores, np.full(combos, level0), np.full(combos, trend0), np.tile(season0, (combos, 1)),
+        alpha, beta, gamma, start=0
+    )
+    best = int(np.argmin(sse))
+    return FittedModel(
+        kind, float(alpha[best]), float(beta[best]), float(gamma[best]),
+        float(level[best]), float(trend[best]), season[best].copy(), float(sse[best]),
+        meses, valores
+    )
+
+
+def get_model(username: Optional[str], kpi_type: str, meses: List[str], valores: np.ndarray) -> FittedModel:
+    """Modelo ajustado para la serie: el de la caché si la serie no ha cambiado, o un ajuste completo."""
+    if username is None:
+        return fit(meses, valores)
+
+    key = (username, kpi_type)
+    cached = model_cache.get(key)
+    if cached is not None and cached.data_version == data_version(meses, valores):
+        return cached
+    model = fit(meses, valores)
+    model_cache.set(key, model)
+    return model
+
+
+def simulate_many(models: List[FittedModel], horizonte: int,
+                  rng: Union[np.random.Generator, Sequence[np.random.Generator]], num_paths: int,
+                  use_seasonality: bool = True, shocks: Optional[np.ndarray] = None,
+                  lead: Optional[List[int]] = None) -> np.ndarray:
+    """
+    Simula varios modelos a la vez: devuelve (modelos, num_paths, horizonte + 1).
+    Los shocks de mercado (num_paths, horizonte), si se dan, son comunes a
+    todos los modelos. rng puede ser un generador por modelo: los errores de
+    cada uno se sacan de su generador mes a mes, así que no dependen de con
+    qué otros modelos se simule.
+
+    lead indica, para cada modelo, cuántos meses sin observar separan su
+    último dato del inicio de la proyección: esos meses se simulan primero
+    (sin shocks de mercado) y la primera columna devuelta es el mes de inicio.
+    """
+    k = len(models)
+    lead = np.zeros(k, dtype=np.int64) if lead is None else np.asarray(lead, dtype=np.int64)
+    pasos = horizonte + int(lead.max(initial=0))
+    columna = lambda valores: np.array(valores, dtype=np.float64)[:, None]
+    level = np.repeat(columna([m.level for m in models]), num_paths, axis=1)
+    trend = np.repeat(columna([m.trend for m in models]), num_paths, axis=1)
+    alpha = columna([m.alpha for m in models])
+    beta = columna([m.beta for m in models])
+    gamma = columna([m.gamma for m in models])
+    seasons = np.array([m.season if use_seasonality else np.zeros(SEASON_LENGTH) for m in models])
+    season = np.repeat(seasons[:, None, :], num_paths, axis=1)
+    offsets = np.array([len(m.valores) for m in models])
+    rngs = [rng] * k if isinstance(rng, np.random.Generator) else list(rng)
+    errors = np.zeros((k, num_paths, pasos))
+    for i, meses_previos in enumerate(lead.tolist()):
+        errors[i, :, :horizonte + meses_previos] = rngs[i].standard_normal((horizonte + meses_previos, num_paths)).T
+    errors *= columna([m.sigma for m in models])[:, :, None]
+    if shocks is not None:
+        # Cada modelo recibe los shocks a partir de su mes de inicio
+        shocks_modelo = np.ones((k, num_paths, pasos))
+        for i, meses_previos in enumerate(lead.tolist()):
+            shocks_modelo[i, :, meses_previos:meses_previos + horizonte] = shocks
+    rows_k = np.arange(k)[:, None]
+    rows_p = np.arange(num_paths)[None, :]
+
+    paths = np.empty((k, num_paths, pasos + 1))
+    paths[:, :, 0] = columna([m.valores[-1] for m in models])
+    for h in range(pasos):
+        idx = ((offsets + h) % SEASON_LENGTH)[:, None]
+        s = season[rows_k, rows_p, idx]
+        error = errors[:, :, h]
+        paths[:, :, h + 1] = level + trend + s + error
+        new_level = level + trend + alpha * error
+        if shocks is not None:
+            new_level = new_level * shocks_modelo[:, :, h]
+        trend = trend + beta * (new_level - level - trend)
+        if use_seasonality:
+            season[rows_k, rows_p, idx] = s + gamma * (1 - alpha) * error
+        level = new_level
+    return np.stack([paths[i, :, j:j + horizonte + 1] for i, j in enumerate(lead.tolist())])
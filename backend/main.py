@@ -1,20 +1,38 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
-from pymongo import MongoClient
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request
+from contextlib import asynccontextmanager
+from functools import partial
+import asyncio
 from dotenv import load_dotenv
 import os
+import copy
 from bson.objectid import ObjectId
 from datetime import datetime, timezone
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from pymongo.errors import DuplicateKeyError
+from executors import ExecutorSaturatedError
 import auth
+import database
+import date_normalization
+import indexes
+import onboarding
+import peer_index
 import json
+import kpi_forecast
+import kpi_models
+import logging
+import time
+import uuid
+import logging_config
 from models import UserCreate, UserLogin
 from fastapi.encoders import jsonable_encoder
-import score_calculator
-import random
+import scorecard
+import score_history
+import score_store
+import what_if
 import pandas as pd
 import importlib.util
 import sys
@@ -23,7 +41,29 @@ import tempfile
 # Cargar variables de entorno
 load_dotenv()
 
-app = FastAPI()
+logging_config.setup_logging()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único pool de conexiones por proceso, creado después del fork del worker
+    database.init_client()
+    await indexes.ensure_collections()
+    await indexes.ensure_indexes()
+    await auth.load_revoked_tokens()
+    revoked_tokens_task = asyncio.create_task(auth.sync_revoked_tokens())
+    user_cache_task = asyncio.create_task(auth.sync_user_cache())
+    peer_index_task = asyncio.create_task(peer_index.refresh_periodically())
+    yield
+    peer_index_task.cancel()
+    revoked_tokens_task.cancel()
+    user_cache_task.cancel()
+    auth.password_executor.shutdown()
+    onboarding.bulk_password_executor.shutdown()
+    kpi_forecast.forecast_executor.shutdown()
+    database.close_client()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:8000",
@@ -40,12 +80,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Conectar a MongoDB
-mongo_uri = os.getenv("MONGO_URI")
-client = MongoClient(mongo_uri)
-db = client["pyme360"] # Base de datos
-test_collection = db["test"]  # Colección para pruebas
-user_collection = db["users"]  # Colección para usuarios
+# ID de petición y tiempo de respuesta en cada registro de log
+@app.middleware("http")
+async def request_context(request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = logging_config.request_id_var.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        logger.info(
+            "%s %s %s", request.method, request.url.path, response.status_code,
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            }
+        )
+        return response
+    finally:
+        logging_config.request_id_var.reset(token)
 
 # Modelo para la solicitud de prueba
 class TestRequest(BaseModel):
@@ -58,36 +113,128 @@ class KpiPredictionRequest(BaseModel):
     include_seasonality: bool = False
     include_market_factors: bool = False
     show_confidence_interval: bool = True
+    granularity: str = "month"
+
+# Modelo para la predicción de varios KPIs en una sola petición
+class KpiBatchPredictionRequest(BaseModel):
+    kpi_types: List[str]
+    period: str
+    include_seasonality: bool = False
+    include_market_factors: bool = False
+    show_confidence_interval: bool = True
+    granularity: str = "month"
+
+KPI_BATCH_MAX_TYPES = int(os.getenv("KPI_BATCH_MAX_TYPES", "10"))
+
+# Modelos para el simulador de escenarios de puntuación crediticia
+class EscenarioCredito(BaseModel):
+    nombre: Optional[str] = None
+    ajustes_saldo: Dict[str, float] = {}
+    ajustes_limite: Dict[str, float] = {}
+    variacion_solicitudes: int = 0
+    pagos_puntuales: int = Field(0, ge=0)
+    pagos_atrasados: int = Field(0, ge=0)
+
+class WhatIfRequest(BaseModel):
+    escenarios: List[EscenarioCredito]
+    scorecard_version: Optional[str] = None
+
+WHAT_IF_MAX_SCENARIOS = int(os.getenv("WHAT_IF_MAX_SCENARIOS", "1000"))
 
 # Modelo para importancias
 class ImportanciasRequest(BaseModel):
     analyzed_data: dict
     target_column: str
 
+# Dependencias de usuario con proyección: cada endpoint carga solo los campos que usa
+usuario_credit_score = auth.get_current_user_fields(
+    *score_store.CREDIT_INPUT_FIELDS,
+    f"{score_store.MATERIALIZED_FIELD}.credit",
+    "informacion_general.sector",
+    "informacion_general.pais"
+)
+usuario_deudas = auth.get_current_user_fields("historial_crediticio")
+usuario_trust_score = auth.get_current_user_fields(
+    *score_store.TRUST_INPUT_FIELDS,
+    f"{score_store.MATERIALIZED_FIELD}.trust",
+    "informacion_general.pais"
+)
+usuario_kpi = auth.get_current_user_fields(
+    "informacion_general.sector",
+    "informacion_general.pais",
+    "finanzas.ingresos_anuales",
+    *kpi_models.SERIES_FIELDS
+)
+usuario_sector = auth.get_current_user_fields("informacion_general.sector", "informacion_general.pais")
+usuario_autenticado = auth.get_current_user_fields()
+
 # Ruta de prueba
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the API"}
 
+# Estadísticas del pool de conexiones de MongoDB
+@app.get("/api/metrics/db-pool")
+def get_db_pool_stats():
+    return {
+        "options": database.get_client_options(),
+        "stats": database.pool_stats.snapshot()
+    }
+
+# Estadísticas de la caché de usuarios autenticados
+@app.get("/api/metrics/user-cache")
+def get_user_cache_stats():
+    return auth.user_cache.stats()
+
+# Estadísticas de la caché de tokens verificados
+@app.get("/api/metrics/token-cache")
+def get_token_cache_stats():
+    return auth.token_cache.stats()
+
+# Estadísticas del pool de hashing de contraseñas
+@app.get("/api/metrics/password-hashing")
+def get_password_hashing_stats():
+    return auth.password_executor.stats()
+
+# Aciertos de las puntuaciones materializadas
+@app.get("/api/metrics/materialized-scores")
+def get_materialized_scores_stats():
+    return score_store.stats.snapshot()
+
+# Tamaño del índice de percentiles por sector y país
+@app.get("/api/metrics/peer-index")
+def get_peer_index_stats():
+    return peer_index.index.stats()
+
+# Caché de modelos de predicción de KPIs ajustados
+@app.get("/api/metrics/kpi-models")
+def get_kpi_models_stats():
+    return {
+        "models": kpi_models.model_cache.stats(),
+        "forecasts": kpi_forecast.forecast_cache.stats(),
+        "executor": kpi_forecast.forecast_executor.stats(),
+    }
+
 # Función para serializar documentos de MongoDB
 def serialize_mongo_document(doc):
-    """Convierte un documento de MongoDB en un diccionario serializable."""
+    """Copia serializable de un documento de MongoDB (el original no se modifica)."""
+    doc = copy.deepcopy(doc)
     if "_id" in doc and isinstance(doc["_id"], ObjectId):
         doc["_id"] = str(doc["_id"])
-    return doc
+    return date_normalization.dates_to_strings(doc)
 
 # Endpoint para probar la conexión
 @app.post("/api/test-connection")
-def test_mongo_connection(request: TestRequest):
+async def test_mongo_connection(request: TestRequest):
     try:
-        print(f"Probando conexión a MongoDB con valor: {request.testValue}")
+        logger.debug("Probando conexión a MongoDB con valor: %s", request.testValue)
         # Insertar el valor en la colección de prueba
         test_data = {
             "test_value": request.testValue,
             "timestamp": datetime.now().isoformat()
         }
-        result = test_collection.insert_one(test_data)
-        print(f"Documento insertado con ID: {result.inserted_id}")
+        result = await database.get_collection("test").insert_one(test_data)
+        logger.debug("Documento insertado con ID: %s", result.inserted_id)
         
         # Devolver respuesta con el ID del documento insertado
         return {
@@ -96,46 +243,51 @@ def test_mongo_connection(request: TestRequest):
             "test_value": request.testValue
         }
     except Exception as e:
-        print(f"Error al conectar con MongoDB: {str(e)}")
+        logger.exception("Error al conectar con MongoDB")
         raise HTTPException(status_code=500, detail=f"Error al conectar con MongoDB: {str(e)}")
 
 # Endpoints de autenticación
 @app.post("/api/auth/register")
 async def register(user_data: UserCreate):
     try:
-        # Verificar si el usuario ya existe
-        existing_user = user_collection.find_one({"username": user_data.username})
-        if existing_user:
-            raise HTTPException(status_code=400, detail="El nombre de usuario ya está en uso")
-        
         # Hashear la contraseña
-        hashed_password = auth.get_password_hash(user_data.password)
+        hashed_password = await auth.get_password_hash_async(user_data.password)
         
         # Preparar el modelo de usuario para guardar
-        user_dict = user_data.model_dump()
-        user_dict["password"] = hashed_password
+        user_dict = onboarding.build_user_document(user_data, hashed_password)
         
-        # Asegurarse de que la información general tenga el país
-        if "informacion_general" in user_dict and "pais" not in user_dict["informacion_general"]:
-            user_dict["informacion_general"]["pais"] = user_data.informacion_general.pais
-        
-        # Insertar el usuario en la base de datos
-        result = user_collection.insert_one(user_dict)
+        # Insertar el usuario en la base de datos; el índice único sobre
+        # username detecta los duplicados sin una consulta previa
+        try:
+            result = await database.get_collection("users").insert_one(user_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="El nombre de usuario ya está en uso")
+        auth.invalidate_user(user_data.username)
         
         return {"message": "Usuario registrado correctamente", "user_id": str(result.inserted_id)}
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"Error en el registro: {str(e)}")
+        logger.exception("Error en el registro")
         raise HTTPException(status_code=500, detail=f"Error en el registro: {str(e)}")
 
+# Alta masiva de empresas: cuerpo NDJSON con un UserCreate por línea.
+# Requiere la cabecera X-Admin-Token (ADMIN_API_TOKEN)
+@app.post("/api/auth/register/bulk", dependencies=[Depends(auth.require_admin_token)])
+async def register_bulk(request: Request):
+    try:
+        return await onboarding.import_users_ndjson(request.stream())
+    except Exception as e:
+        logger.exception("Error en el alta masiva")
+        raise HTTPException(status_code=500, detail=f"Error en el alta masiva: {str(e)}")
+
 @app.post("/api/auth/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        print(f"Intento de login: {form_data.username}")
-        user = auth.authenticate_user(form_data.username, form_data.password)
+        logger.debug("Intento de login: %s", form_data.username)
+        user = await auth.authenticate_user(form_data.username, form_data.password)
         if not user:
-            print(f"Autenticación fallida para {form_data.username}")
+            logger.info("Autenticación fallida para %s", form_data.username)
             raise HTTPException(
                 status_code=401,
                 detail="Credenciales incorrectas",
@@ -147,39 +299,93 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             data={"sub": user["username"]}
         )
         
-        print(f"Login exitoso para {form_data.username}")
+        logger.debug("Login exitoso para %s", form_data.username)
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException as he:
-        print(f"Error HTTP en login: {he.detail}")
+        logger.debug("Error HTTP en login: %s", he.detail)
         raise he
     except Exception as e:
-        print(f"Error desconocido en login: {str(e)}")
+        logger.exception("Error desconocido en login")
         raise HTTPException(status_code=500, detail=f"Error de autenticación: {str(e)}")
 
+@app.post("/api/auth/logout")
+async def logout(token: str = Depends(auth.oauth2_scheme)):
+    await auth.revoke_token(token)
+    return {"message": "Sesión cerrada correctamente"}
+
 @app.get("/api/auth/me")
 async def get_current_user(current_user: dict = Depends(auth.get_current_user)):
-    # Eliminar la contraseña del objeto de usuario
-    if "password" in current_user:
-        current_user.pop("password")
-    
     # Convertir ObjectId a string
     current_user_serializable = serialize_mongo_document(current_user)
+    
+    # Eliminar la contraseña del objeto de usuario
+    current_user_serializable.pop("password", None)
     return jsonable_encoder(current_user_serializable)
 
 # Nuevos endpoints para la puntuación crediticia
 @app.get("/api/credit-score")
-async def get_credit_score(current_user: dict = Depends(auth.get_current_user)):
+async def get_credit_score(scorecard_version: Optional[str] = None, current_user: dict = Depends(usuario_credit_score)):
+    if scorecard_version is not None and scorecard_version not in scorecard.available_versions():
+        raise HTTPException(status_code=400, detail=f"Versión de scorecard desconocida: {scorecard_version}")
     try:
-        # Calcular puntuación crediticia
-        credit_score = score_calculator.calculate_credit_score(current_user)
+        # Puntuación materializada, con la gráfica del histórico real ya incluida
+        credit_score = await score_store.get_credit_score(current_user, scorecard_version)
+        credit_score["peer_percentile"] = _peer_percentile(
+            current_user, "credit", credit_score["scorecard_version"], credit_score["score"]
+        )
         return credit_score
     except Exception as e:
-        print(f"Error al calcular puntuación crediticia: {str(e)}")
+        logger.exception("Error al calcular puntuación crediticia")
         raise HTTPException(status_code=500, detail=f"Error al calcular puntuación crediticia: {str(e)}")
 
+def _peer_percentile(current_user: dict, kind: str, version: Optional[str], score):
+    """Actualiza el índice con la puntuación servida y devuelve su percentil entre los pares."""
+    informacion_general = current_user.get("informacion_general", {})
+    peer_index.index.update(kind, version, informacion_general, current_user["username"], score)
+    return peer_index.index.percentile(kind, version, informacion_general, score)
+
+# Histórico de puntuaciones por rango de fechas, agregado por día, mes o trimestre
+@app.get("/api/credit-score/history")
+async def get_credit_score_history(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "month",
+    scorecard_version: Optional[str] = None,
+    current_user: dict = Depends(usuario_autenticado)
+):
+    return await _score_history_response(current_user["username"], "credit", since, until, granularity, scorecard_version)
+
+async def _score_history_response(username, kind, since, until, granularity, version=None):
+    try:
+        rows = await score_history.get_history(username, kind, since, until, granularity, version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for row in rows:
+        row["label"] = score_history.period_label(row["period"], granularity)
+    return {"granularity": granularity, "history": rows}
+
+# Simulador de escenarios: evalúa todas las variaciones en una sola pasada vectorizada
+@app.post("/api/credit-score/what-if")
+async def simulate_credit_scenarios(request: WhatIfRequest, current_user: dict = Depends(usuario_credit_score)):
+    if len(request.escenarios) > WHAT_IF_MAX_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"Como máximo {WHAT_IF_MAX_SCENARIOS} escenarios por petición")
+    if request.scorecard_version is not None and request.scorecard_version not in scorecard.available_versions():
+        raise HTTPException(status_code=400, detail=f"Versión de scorecard desconocida: {request.scorecard_version}")
+    try:
+        return what_if.simulate(
+            current_user,
+            [escenario.model_dump() for escenario in request.escenarios],
+            version=request.scorecard_version
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error al simular escenarios de crédito")
+        raise HTTPException(status_code=500, detail=f"Error al simular escenarios de crédito: {str(e)}")
+
 # Endpoint para obtener deudas activas del usuario
 @app.get("/api/active-debts")
-async def get_active_debts(current_user: dict = Depends(auth.get_current_user)):
+async def get_active_debts(current_user: dict = Depends(usuario_deudas)):
     try:
         historial_crediticio = current_user.get("historial_crediticio", {})
         
@@ -246,20 +452,32 @@ async def get_active_debts(current_user: dict = Depends(auth.get_current_user)):
         
         return {"deudas": deudas}
     except Exception as e:
-        print(f"Error al obtener deudas activas: {str(e)}")
+        logger.exception("Error al obtener deudas activas")
         raise HTTPException(status_code=500, detail=f"Error al obtener deudas activas: {str(e)}")
 
 # Endpoint para obtener el PyME360 Trust Score
 @app.get("/api/trust-score")
-async def get_trust_score(current_user: dict = Depends(auth.get_current_user)):
+async def get_trust_score(current_user: dict = Depends(usuario_trust_score)):
     try:
-        # Calcular PyME360 Trust Score
-        trust_score = score_calculator.calculate_trust_score(current_user)
+        # Trust Score materializado, con la gráfica del histórico real ya incluida
+        trust_score = await score_store.get_trust_score(current_user)
+        trust_score["peer_percentile"] = _peer_percentile(
+            current_user, "trust", None, trust_score.get("calificacion_global")
+        )
         return trust_score
     except Exception as e:
-        print(f"Error al calcular PyME360 Trust Score: {str(e)}")
+        logger.exception("Error al calcular PyME360 Trust Score")
         raise HTTPException(status_code=500, detail=f"Error al calcular PyME360 Trust Score: {str(e)}")
 
+@app.get("/api/trust-score/history")
+async def get_trust_score_history(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "month",
+    current_user: dict = Depends(usuario_autenticado)
+):
+    return await _score_history_response(current_user["username"], "trust", since, until, granularity)
+
 # Nuevo endpoint para consultar al asistente IA de financiamiento
 @app.post("/api/financing-assistant")
 async def query_financing_assistant(
@@ -280,7 +498,7 @@ async def query_financing_assistant(
         
         return {"response": response_text}
     except Exception as e:
-        print(f"Error al consultar al asistente IA: {str(e)}")
+        logger.exception("Error al consultar al asistente IA")
         raise HTTPException(status_code=500, detail=f"Error al consultar al asistente IA: {str(e)}")
 
 # Nuevo endpoint para consultar al asistente IA general
@@ -310,201 +528,79 @@ async def query_general_assistant(
         
         return {"response": response_text}
     except Exception as e:
-        print(f"Error al consultar al asistente IA general: {str(e)}")
+        logger.exception("Error al consultar al asistente IA general")
         raise HTTPException(status_code=500, detail=f"Error al consultar al asistente IA general: {str(e)}")
 
+def _forecast_saturated() -> HTTPException:
+    logger.warning("Cola de predicciones de KPIs saturada")
+    return HTTPException(
+        status_code=503,
+        detail="Servicio de predicción saturado, inténtalo de nuevo en unos segundos",
+        headers={"Retry-After": "2"},
+    )
+
 # Nuevo endpoint para predicciones de KPIs
 @app.post("/api/kpi-prediction")
 async def predict_kpi(
     request: KpiPredictionRequest,
-    current_user: dict = Depends(auth.get_current_user)
+    current_user: dict = Depends(usuario_kpi)
 ):
     try:
-        print(f"Generando predicción para KPI: {request.kpi_type}")
-        
-        # Obtener información del usuario
-        info_general = current_user.get("informacion_general", {})
-        sector = info_general.get("sector", "Tecnología")
-        pais = info_general.get("pais", "México")
-        
-        # Variables financieras
-        finanzas = current_user.get("finanzas", {})
-        ingresos_base = finanzas.get("ingresos_anuales", random.randint(8000, 15000))
-        
-        # Período en meses
-        periodo_meses = 12
-        if request.period == "12m":
-            periodo_meses = 12
-        elif request.period == "24m":
-            periodo_meses = 24
-        elif request.period == "36m":
-            periodo_meses = 36
-        
-        # Calcular tasa de crecimiento basada en el sector
-        tasas_crecimiento = {
-            "Tecnología": random.uniform(0.08, 0.15),
-            "Retail": random.uniform(0.05, 0.12),
-            "Servicios": random.uniform(0.06, 0.10),
-            "Manufactura": random.uniform(0.04, 0.09),
-            "Construcción": random.uniform(0.03, 0.08),
-            "Salud": random.uniform(0.07, 0.14),
-        }
-        tasa_mensual = tasas_crecimiento.get(sector, random.uniform(0.05, 0.10)) / 12
-        
-        # Ajustar por país
-        multiplicadores_pais = {
-            "México": 1.0,
-            "Colombia": 1.1,
-            "Chile": 1.2,
-            "Perú": 0.9,
-            "Argentina": 0.85,
-            "España": 1.15
-        }
-        tasa_mensual *= multiplicadores_pais.get(pais, 1.0)
-        
-        # Generar datos mensuales
-        valores_mensuales = []
-        valor_actual = ingresos_base
-        
-        for i in range(periodo_meses + 1):  # +1 para incluir el valor inicial
-            # Añadir factores de estacionalidad si se solicita
-            factor_estacional = 1.0
-            if request.include_seasonality:
-                # Estacionalidad basada en el mes (suponiendo que empezamos en enero)
-                mes_actual = (i % 12) + 1
-                if mes_actual in [11, 12]:  # Noviembre y diciembre
-                    factor_estacional = 1.2  # Temporada alta
-                elif mes_actual in [1, 2]:  # Enero y febrero
-                    factor_estacional = 0.8  # Temporada baja
-            
-            # Añadir factores de mercado aleatorios si se solicita
-            factor_mercado = 1.0
-            if request.include_market_factors and random.random() < 0.3:  # 30% de probabilidad de evento de mercado
-                factor_mercado = random.uniform(0.9, 1.1)
-            
-            # Calcular valor con todos los factores
-            if i > 0:  # Para el primer punto, usar el valor base
-                crecimiento = (1 + tasa_mensual) * factor_estacional * factor_mercado
-                volatilidad = random.uniform(0.97, 1.03)  # Añadir algo de ruido
-                valor_actual = valor_actual * crecimiento * volatilidad
-            
-            # Añadir a la lista de valores mensuales
-            valores_mensuales.append(round(valor_actual, 2))
-        
-        # Calcular valor final e incremento total
-        valor_inicial = valores_mensuales[0]
-        valor_final = valores_mensuales[-1]
-        crecimiento_total = ((valor_final / valor_inicial) - 1) * 100
-        crecimiento_mensual = ((1 + crecimiento_total/100) ** (1/periodo_meses) - 1) * 100
-        
-        # Identificar meses con eventos especiales
-        eventos_mercado = []
-        fechas_base = ["ene", "feb", "mar", "abr", "may", "jun", "jul", "ago", "sept", "oct", "nov", "dic"]
-        años = [2024, 2025, 2026, 2027]
-        
-        # Generar entre 2 y 4 eventos
-        num_eventos = random.randint(2, 4)
-        eventos_posibles = [
-            {"mes": "may", "año": 2025, "descripcion": "Temporada alta"},
-            {"mes": "oct", "año": 2025, "descripcion": "Desaceleración del mercado"},
-            {"mes": "ene", "año": 2026, "descripcion": "Impulso pre-festividades"},
-            {"mes": "jul", "año": 2026, "descripcion": "Expansión del sector"},
-            {"mes": "dic", "año": 2025, "descripcion": "Cierre fiscal favorable"},
-            {"mes": "mar", "año": 2026, "descripcion": "Nuevas regulaciones"}
-        ]
-        
-        eventos_seleccionados = random.sample(eventos_posibles, min(num_eventos, len(eventos_posibles)))
-        for evento in eventos_seleccionados:
-            eventos_mercado.append(evento)
-        
-        # Etiquetas para el eje X (meses)
-        etiquetas_meses = []
-        for i in range(periodo_meses + 1):
-            mes_idx = i % 12
-            año = años[i // 12]
-            etiqueta = f"{fechas_base[mes_idx]} {año}"
-            etiquetas_meses.append(etiqueta)
-        
-        # Crear intervalo de confianza (valores superior e inferior)
-        if request.show_confidence_interval:
-            valores_superior = [v * random.uniform(1.05, 1.15) for v in valores_mensuales]
-            valores_inferior = [v * random.uniform(0.85, 0.95) for v in valores_mensuales]
-        else:
-            valores_superior = valores_mensuales
-            valores_inferior = valores_mensuales
-        
-        # Determinar volatilidad
-        volatilidad = round(random.uniform(6.5, 12.5), 2)
-        
-        # Determinar mes de mayor y menor crecimiento
-        incrementos_mensuales = []
-        for i in range(1, len(valores_mensuales)):
-            incremento = ((valores_mensuales[i] / valores_mensuales[i-1]) - 1) * 100
-            incrementos_mensuales.append({"mes": etiquetas_meses[i], "incremento": incremento})
-        
-        incrementos_mensuales.sort(key=lambda x: x["incremento"], reverse=True)
-        mejor_mes = incrementos_mensuales[0]["mes"]
-        mejor_incremento = round(incrementos_mensuales[0]["incremento"], 2)
-        
-        peor_mes = incrementos_mensuales[-1]["mes"]
-        peor_incremento = round(incrementos_mensuales[-1]["incremento"], 2)
-        
-        # Crear recomendación basada en los resultados
-        recomendacion = ""
-        if crecimiento_total > 50:
-            recomendacion = "Basado en tu proyección de ingresos, es recomendable preparar tu operación para escalar rápidamente. Considera invertir en capacidad adicional y optimizar procesos para mantener la calidad durante este fuerte crecimiento."
-        elif crecimiento_total > 20:
-            recomendacion = "Tu negocio muestra un crecimiento sólido. Recomendamos reforzar tus procesos operativos y comenzar a planificar la siguiente fase de expansión para aprovechar esta tendencia positiva."
-        else:
-            recomendacion = "Tu proyección muestra un crecimiento moderado. Enfócate en optimizar costos y mejorar márgenes, mientras exploras nuevas oportunidades de mercado para acelerar el crecimiento."
-        
-        # Añadir recomendación sobre volatilidad
-        if volatilidad > 10:
-            recomendacion += " La tendencia histórica volátil sugiere preparar planes de contingencia para diferentes escenarios. Mantén reservas operativas y financieras para adaptarte a cambios bruscos."
-        else:
-            recomendacion += " Tu negocio muestra una tendencia estable, lo que facilita la planificación a largo plazo. Aprovecha esta estabilidad para realizar inversiones estratégicas con mayor confianza."
-        
-        # Construir respuesta
-        respuesta = {
-            "kpi_type": request.kpi_type,
-            "initial_value": valor_inicial,
-            "final_value": valor_final,
-            "monthly_values": valores_mensuales,
-            "upper_limit": valores_superior,
-            "lower_limit": valores_inferior,
-            "total_growth_percentage": round(crecimiento_total, 2),
-            "monthly_growth_percentage": round(crecimiento_mensual, 2),
-            "volatility": volatilidad,
-            "month_labels": etiquetas_meses,
-            "market_events": eventos_mercado,
-            "best_month": {
-                "month": mejor_mes,
-                "growth": mejor_incremento
-            },
-            "worst_month": {
-                "month": peor_mes,
-                "growth": peor_incremento
-            },
-            "factors": {
-                "seasonality": request.include_seasonality,
-                "market_factors": request.include_market_factors,
-                "country": pais,
-                "sector": sector
-            },
-            "recommendation": recomendacion,
-            "confidence": "moderada"
-        }
-        
-        return respuesta
+        logger.debug("Generando predicción para KPI: %s", request.kpi_type)
+        return await kpi_forecast.forecast_executor.run(partial(
+            kpi_forecast.cached_forecast,
+            current_user,
+            request.kpi_type,
+            request.period,
+            include_seasonality=request.include_seasonality,
+            include_market_factors=request.include_market_factors,
+            show_confidence_interval=request.show_confidence_interval,
+            granularity=request.granularity
+        ))
+    except ExecutorSaturatedError:
+        raise _forecast_saturated()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error al generar predicción de KPI: {str(e)}")
+        logger.exception("Error al generar predicción de KPI")
         raise HTTPException(status_code=500, detail=f"Error al generar predicción de KPI: {str(e)}")
 
+# Predicción de varios KPIs: carga el usuario una vez y comparte las simulaciones
+@app.post("/api/kpi-prediction/batch")
+async def predict_kpis(
+    request: KpiBatchPredictionRequest,
+    current_user: dict = Depends(usuario_kpi)
+):
+    if not request.kpi_types:
+        raise HTTPException(status_code=400, detail="Indica al menos un KPI")
+    if len(set(request.kpi_types)) > KPI_BATCH_MAX_TYPES:
+        raise HTTPException(status_code=400, detail=f"Como máximo {KPI_BATCH_MAX_TYPES} KPIs por petición")
+    try:
+        logger.debug("Generando predicciones para KPIs: %s", request.kpi_types)
+        predicciones = await kpi_forecast.forecast_executor.run(partial(
+            kpi_forecast.cached_forecast_many,
+            current_user,
+            request.kpi_types,
+            request.period,
+            include_seasonality=request.include_seasonality,
+            include_market_factors=request.include_market_factors,
+            show_confidence_interval=request.show_confidence_interval,
+            granularity=request.granularity
+        ))
+        return {"predictions": predicciones}
+    except ExecutorSaturatedError:
+        raise _forecast_saturated()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error al generar predicciones de KPIs")
+        raise HTTPException(status_code=500, detail=f"Error al generar predicciones de KPIs: {str(e)}")
+
 # Nuevo endpoint para consultar al asistente de documentación
 @app.post("/api/documentation-assistant")
 async def query_documentation_assistant(
     question: dict,
-    current_user: dict = Depends(auth.get_current_user)
+    current_user: dict = Depends(usuario_autenticado)
 ):
     try:
         from agents.agentedocumentacion import query
@@ -523,14 +619,14 @@ async def query_documentation_assistant(
         
         return {"response": response_text}
     except Exception as e:
-        print(f"Error al consultar al asistente de documentación: {str(e)}")
+        logger.exception("Error al consultar al asistente de documentación")
         raise HTTPException(status_code=500, detail=f"Error al consultar al asistente de documentación: {str(e)}")
 
 # Nuevo endpoint para consultar al asistente de tendencias de mercado
 @app.post("/api/market-trends")
 async def query_market_trends(
     question: dict,
-    current_user: dict = Depends(auth.get_current_user)
+    current_user: dict = Depends(usuario_sector)
 ):
     try:
         from agents.tendencias import query
@@ -544,7 +640,7 @@ async def query_market_trends(
         
         return response
     except Exception as e:
-        print(f"Error al consultar tendencias de mercado: {str(e)}")
+        logger.exception("Error al consultar tendencias de mercado")
         raise HTTPException(status_code=500, detail=f"Error al consultar tendencias de mercado: {str(e)}")
 
 # NUEVO ENDPOINT para análisis de datos
@@ -554,7 +650,7 @@ async def analyze_data(
     target_column: str = Form(...)
 ):
     try:
-        print(f"Recibiendo archivo para análisis: {file.filename}")
+        logger.debug("Recibiendo archivo para análisis: %s", file.filename)
         
         # Guardar el archivo recibido en un archivo temporal
         with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as temp_file:
@@ -579,16 +675,14 @@ async def analyze_data(
         
         return result
     except Exception as e:
-        print(f"Error al analizar datos: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error al analizar datos")
         raise HTTPException(status_code=500, detail=f"Error al analizar datos: {str(e)}")
 
 # NUEVO ENDPOINT para procesamiento con importancias.py
 @app.post("/api/importancias")
 async def process_importancias(request: ImportanciasRequest):
     try:
-        print(f"Procesando datos para importancias.py con columna objetivo: {request.target_column}")
+        logger.debug("Procesando datos para importancias.py con columna objetivo: %s", request.target_column)
         
         # Importar el módulo de importancias.py
         from agents import importancias
@@ -646,15 +740,13 @@ async def process_importancias(request: ImportanciasRequest):
                 
                 return processed_data
             except Exception as json_err:
-                print(f"Error al procesar JSON en la respuesta: {str(json_err)}")
+                logger.warning("Error al procesar JSON en la respuesta: %s", json_err)
                 return {"response_text": result.get("text", ""), "processed": False}
         else:
             return {"response": result, "processed": False}
             
     except Exception as e:
-        print(f"Error al procesar con importancias.py: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error al procesar con importancias.py")
         raise HTTPException(status_code=500, detail=f"Error al procesar con importancias.py: {str(e)}")
 
 if __name__ == "__main__":
@@ -1,24 +1,30 @@
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
-from pymongo.collection import Collection
-from pymongo.database import Database
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
 from bson import ObjectId
 import os, json
+import logging
 from dotenv import load_dotenv
 from models import *
+import database
+import date_normalization
+import auth
 import datetime
+from typing import AsyncIterator, List, Optional, Tuple
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+
 MAX_MESSAGES = 25
+DEFAULT_BATCH_SIZE = 500
 
 class MongoDBClient:
     def __init__(self, db_name="pyme360"):
         """
-        Initializes the MongoDB client with authentication.
+        Initializes the MongoDB client on top of the shared connection pool.
         
         :param db_name: Database name
         """
-        self.uri = os.getenv("MONGO_URI")
         self.db_name = db_name
         self.client = None
         self.db = None
@@ -26,61 +32,188 @@ class MongoDBClient:
         self.users_collection = self.db["users"]  # Cambiado de usuarios a users
     
     def connect(self):
-        """Establishes the connection with MongoDB."""
+        """Attaches to the process-wide client (see database.py)."""
+        self.client = database.get_client()
+        self.db = self.client[self.db_name]
+    
+    async def ping(self) -> bool:
+        """Checks that the server is reachable."""
         try:
-            self.client = MongoClient(self.uri)
-            self.db = self.client[self.db_name]
-            self.client.admin.command("ping")
-            print(f"Connected to MongoDB: {self.db_name}")
+            await self.client.admin.command("ping")
+            logger.info("Connected to MongoDB: %s", self.db_name)
+            return True
         except ConnectionFailure as e:
-            print(f"Connection error: {e}")
+            logger.error("Connection error: %s", e)
+            return False
     
-    def get_collection(self, collection_name: str) -> Collection:
+    def get_collection(self, collection_name: str) -> AsyncIOMotorCollection:
         return self.db[collection_name]
     
-    def insert_one(self, collection_name: str, document: dict) -> str:
+    async def insert_one(self, collection_name: str, document: dict) -> str:
         collection = self.get_collection(collection_name)
-        result = collection.insert_one(document)
+        if collection_name == "users":
+            date_normalization.normalize_document(document)
+        result = await collection.insert_one(document)
         return str(result.inserted_id)
     
-    def find_one(self, collection_name: str, query: dict) -> dict:
+    async def find_one(self, collection_name: str, query: dict) -> dict:
         collection = self.get_collection(collection_name)
-        return collection.find_one(query)
+        return await collection.find_one(query)
     
-    def find_many(self, collection_name: str, query: dict) -> list:
+    async def find_many(self, collection_name: str, query: dict) -> list:
+        """Loads every matching document into memory. Use iter_many for large result sets."""
+        collection = self.get_collection(collection_name)
+        return await collection.find(query).to_list(length=None)
+    
+    async def iter_many(
+        self,
+        collection_name: str,
+        query: dict,
+        projection: Optional[dict] = None,
+        sort: Optional[List[Tuple[str, int]]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> AsyncIterator[dict]:
+        """
+        Iterates over the matching documents in constant memory: the driver
+        fetches them from the server batch_size at a time.
+        """
+        collection = self.get_collection(collection_name)
+        cursor = collection.find(query, projection, sort=sort, batch_size=batch_size)
+        try:
+            async for document in cursor:
+                yield document
+        finally:
+            await cursor.close()
+    
+    async def find_page(
+        self,
+        collection_name: str,
+        query: dict,
+        page_size: int = DEFAULT_BATCH_SIZE,
+        after: Optional[dict] = None,
+        sort_field: str = "_id",
+        projection: Optional[dict] = None
+    ) -> Tuple[list, Optional[dict]]:
+        """
+        Returns one page of documents ordered by (sort_field, _id) and the
+        token to request the next one (None on the last page).
+        
+        Pagination is keyset-based: the token holds the last key read, so a
+        job can persist it and resume from that point after a restart, and
+        the cost of each page does not grow with the offset.
+        
+        Documents where sort_field is missing or null sort first, as MongoDB
+        orders them; the token stores None for them.
+        """
+        page_query = query
+        if after is not None:
+            if sort_field == "_id":
+                condition = {"_id": {"$gt": after["_id"]}}
+            elif after["value"] is None:
+                # $gt: null matches nothing: every non-null value comes after
+                condition = {"$or": [
+                    {sort_field: {"$ne": None}},
+                    {sort_field: None, "_id": {"$gt": after["_id"]}},
+                ]}
+            else:
+                condition = {"$or": [
+                    {sort_field: {"$gt": after["value"]}},
+                    {sort_field: after["value"], "_id": {"$gt": after["_id"]}},
+                ]}
+            page_query = {"$and": [query, condition]} if query else condition
+        
+        # _id and the sort key must come back in every document to build the token
+        hide_id = projection is not None and not projection.get("_id", 1)
+        if projection is not None:
+            projection = {field: value for field, value in projection.items() if field != "_id"}
+            if any(projection.values()):
+                projection[sort_field] = 1
+            else:
+                projection.pop(sort_field, None)
+            projection = projection or None
+        
+        sort = [("_id", ASCENDING)] if sort_field == "_id" else [(sort_field, ASCENDING), ("_id", ASCENDING)]
         collection = self.get_collection(collection_name)
-        return list(collection.find(query))
+        documents = await collection.find(page_query, projection, sort=sort, limit=page_size).to_list(length=page_size)
+        
+        next_token = None
+        if len(documents) == page_size:
+            last = documents[-1]
+            next_token = {"_id": last["_id"]}
+            if sort_field != "_id":
+                next_token["value"] = self._get_field(last, sort_field)
+        
+        if hide_id:
+            for document in documents:
+                document.pop("_id", None)
+        return documents, next_token
+    
+    async def iter_pages(
+        self,
+        collection_name: str,
+        query: dict,
+        page_size: int = DEFAULT_BATCH_SIZE,
+        after: Optional[dict] = None,
+        sort_field: str = "_id",
+        projection: Optional[dict] = None
+    ) -> AsyncIterator[Tuple[list, Optional[dict]]]:
+        """Yields (page, next_token) until the collection is exhausted."""
+        while True:
+            page, after = await self.find_page(collection_name, query, page_size, after, sort_field, projection)
+            if page:
+                yield page, after
+            if after is None:
+                return
+    
+    @staticmethod
+    def _get_field(document: dict, path: str):
+        value = document
+        for part in path.split("."):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
     
-    def update_one(self, collection_name: str, query: dict, update: dict) -> int:
+    def _invalidate_users(self, collection_name: str, query: dict):
+        """Invalida la caché de usuarios tras escribir en la colección users."""
+        if collection_name == "users":
+            auth.invalidate_user(query.get("username"))
+    
+    async def update_one(self, collection_name: str, query: dict, update: dict) -> int:
         collection = self.get_collection(collection_name)
-        result = collection.update_one(query, {'$set': update})
+        if collection_name == "users":
+            date_normalization.normalize_update(update)
+            update = {**update, **database.users_update_stamp()}
+        result = await collection.update_one(query, {'$set': update})
+        self._invalidate_users(collection_name, query)
         return result.modified_count
     
-    def delete_one(self, collection_name: str, query: dict) -> int:
+    async def delete_one(self, collection_name: str, query: dict) -> int:
         collection = self.get_collection(collection_name)
-        result = collection.delete_one(query)
+        result = await collection.delete_one(query)
+        self._invalidate_users(collection_name, query)
         return result.deleted_count
     
     # Métodos adaptados para la colección users
-    def get_user(self, username: str):
+    async def get_user(self, username: str):
         """Recupera el usuario basado en su nombre de usuario.
         Si no existe devuelve None."""
         try:
-            return self.users_collection.find_one({"username": username}, {"_id": 0})  # Exclude MongoDB _id field
-        except Exception as e:
-            print(f"MongoDB Error: {e}")
+            return await self.users_collection.find_one({"username": username}, {"_id": 0})  # Exclude MongoDB _id field
+        except Exception:
+            logger.exception("MongoDB Error")
             return None
     
-    def get_user_by_id(self, user_id: str):
+    async def get_user_by_id(self, user_id: str):
         """Recupera el usuario basado en su ID.
         Si no existe devuelve None."""
         try:
-            return self.users_collection.find_one({"_id": ObjectId(user_id)}, {"_id": 0})
-        except Exception as e:
-            print(f"MongoDB Error: {e}")
+            return await self.users_collection.find_one({"_id": ObjectId(user_id)}, {"_id": 0})
+        except Exception:
+            logger.exception("MongoDB Error")
             return None
     
-    def get_dict_usuario(self, username: str):
+    async def get_dict_usuario(self, username: str):
         """
         Recupera los datos del usuario desde MongoDB y los convierte en un diccionario sin modificaciones.
 
@@ -90,58 +223,62 @@ class MongoDBClient:
         Retorna:
         - dict: Diccionario con la información del usuario o None si no se encuentra.
         """
-        usuario_data = self.get_user(username)
+        usuario_data = await self.get_user(username)
         if not usuario_data:
             return None  # Si no se encuentra el usuario, retorna None
 
-        return json.loads(json.dumps(usuario_data))  # Asegura que sea un dict estándar
+        usuario_data = date_normalization.dates_to_strings(usuario_data)
+        return json.loads(json.dumps(usuario_data, default=str))  # Asegura que sea un dict estándar
     
-    def insertar_usuario_inicial(self, user_data: UserCreate) -> bool:
-        existing_user = self.users_collection.find_one({"username": user_data.username})
-        if existing_user:
-            print(f"Usuario '{user_data.username}' ya existe.")
+    async def insertar_usuario_inicial(self, user_data: UserCreate) -> bool:
+        try:
+            await self.users_collection.insert_one({
+                **date_normalization.normalize_document(user_data.model_dump()),
+                **database.users_update_stamp(),
+            })
+        except DuplicateKeyError:
+            logger.info("Usuario '%s' ya existe.", user_data.username)
             return False
-        user_data = user_data.model_dump()
-        result = self.users_collection.insert_one(user_data)
         return True
     
     # Métodos nuevos para manejar los datos de caso1.json
-    def get_empresa_data(self, username: str):
+    async def get_empresa_data(self, username: str):
         """Recupera los datos de la empresa del usuario."""
-        user = self.get_user(username)
+        user = await self.get_user(username)
         if not user or "empresa_data" not in user:
             return None
         return user["empresa_data"]
     
-    def update_empresa_data(self, username: str, empresa_data: dict) -> bool:
+    async def update_empresa_data(self, username: str, empresa_data: dict) -> bool:
         """Actualiza los datos de la empresa del usuario."""
         try:
-            result = self.users_collection.update_one(
+            result = await self.users_collection.update_one(
                 {"username": username},
-                {"$set": {"empresa_data": empresa_data}}
+                {"$set": {"empresa_data": empresa_data, **database.users_update_stamp()}}
             )
+            auth.invalidate_user(username)
             return result.modified_count > 0
-        except Exception as e:
-            print(f"Error actualizando datos de empresa: {e}")
+        except Exception:
+            logger.exception("Error actualizando datos de empresa")
             return False
     
-    def get_historial_crediticio(self, username: str):
+    async def get_historial_crediticio(self, username: str):
         """Recupera el historial crediticio de la empresa del usuario."""
-        empresa_data = self.get_empresa_data(username)
+        empresa_data = await self.get_empresa_data(username)
         if not empresa_data or "historial_crediticio" not in empresa_data:
             return None
         return empresa_data["historial_crediticio"]
     
-    def get_ventas_mensuales(self, username: str):
+    async def get_ventas_mensuales(self, username: str):
         """Recupera las ventas mensuales de la empresa del usuario."""
-        empresa_data = self.get_empresa_data(username)
+        empresa_data = await self.get_empresa_data(username)
         if not empresa_data or "ventas_mensuales" not in empresa_data:
             return None
         return empresa_data["ventas_mensuales"]
     
-    def get_pyme360_trust_score(self, username: str):
+    async def get_pyme360_trust_score(self, username: str):
         """Recupera el pyme360_trust_score de la empresa del usuario."""
-        empresa_data = self.get_empresa_data(username)
+        empresa_data = await self.get_empresa_data(username)
         if not empresa_data or "pyme360_trust_score" not in empresa_data:
             return None
         return empresa_data["pyme360_trust_score"]
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Alta masiva de empresas a partir de un flujo NDJSON de registros UserCreate.
+
+El cuerpo se procesa de forma incremental: cada línea se valida al llegar,
+los registros válidos se agrupan en lotes, las contraseñas de cada lote se
+hashean en un pool de hilos propio (para no competir con los logins) y el
+lote se escribe con un único insert_many no ordenado.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+import auth
+import database
+import date_normalization
+from executors import BoundedExecutor, ExecutorSaturatedError, default_workers
+from models import UserCreate
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "1000"))
+# Límites por petición: registros y bytes por línea
+BULK_MAX_RECORDS = int(os.getenv("BULK_MAX_RECORDS", "10000"))
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", str(1024 * 1024)))
+
+bulk_password_executor = BoundedExecutor(
+    "bcrypt-bulk",
+    max_workers=int(os.getenv("BULK_HASH_WORKERS", str(default_workers()))),
+    max_queue=int(os.getenv("BULK_HASH_MAX_QUEUE", "16"))
+)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _hash_passwords(passwords: List[str]) -> List[str]:
+    return [auth.get_password_hash(password) for password in passwords]
+
+
+async def _hash_batch(passwords: List[str]) -> List[str]:
+    """Reparte el lote en un trozo por hilo del pool y concatena los hashes."""
+    workers = bulk_password_executor.max_workers
+    chunk_size = max(1, -(-len(passwords) // workers))
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+
+    results = await asyncio.gather(*(
+        bulk_password_executor.run(_hash_passwords, chunk) for chunk in chunks
+    ))
+    return [hashed for result in results for hashed in result]
+
+
+class BulkImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.limit_exceeded = False
+        self.started_at = time.perf_counter()
+
+    def add_error(self, line: int, username, error: str):
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"line": line, "username": username, "error": error})
+
+    def to_dict(self) -> Dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "limit_exceeded": self.limit_exceeded,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(self.received / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+async def _iter_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int = BULK_MAX_LINE_BYTES
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Divide el flujo de bytes en líneas numeradas (desde 1) sin leerlo entero.
+    Solo se busca el salto de línea en cada trozo nuevo, y las líneas de más
+    de max_line_bytes se descartan según llegan y se devuelven como None.
+    """
+    buffer = bytearray()
+    too_long = False
+    line_number = 0
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                break
+            line_number += 1
+            if too_long or len(buffer) + end - start > max_line_bytes:
+                yield line_number, None
+            else:
+                buffer += chunk[start:end]
+                yield line_number, bytes(buffer)
+            buffer.clear()
+            too_long = False
+            start = end + 1
+
+        if too_long:
+            continue
+        if len(buffer) + len(chunk) - start > max_line_bytes:
+            buffer.clear()
+            too_long = True
+        else:
+            buffer += chunk[start:]
+    if buffer or too_long:
+        yield line_number + 1, None if too_long else bytes(buffer)
+
+
+def build_user_document(user_data: UserCreate, hashed_password: str) -> Dict:
+    """Documento a insertar en users para un alta (individual o masiva)."""
+    user_dict = user_data.model_dump()
+    user_dict["password"] = hashed_password
+
+    # Asegurarse de que la información general tenga el país
+    if "informacion_general" in user_dict and "pais" not in user_dict["informacion_general"]:
+        user_dict["informacion_general"]["pais"] = user_data.informacion_general.pais
+
+    # Guardar las fechas de la puntuación como fechas nativas
+    date_normalization.normalize_document(user_dict)
+    user_dict.update(database.users_update_stamp())
+    return user_dict
+
+
+async def _flush(batch: List[Tuple[int, UserCreate]], report: BulkImportReport):
+    try:
+        hashed = await _hash_batch([user.password for _, user in batch])
+    except ExecutorSaturatedError as e:
+        for line, user in batch:
+            report.add_error(line, user.username, str(e))
+        return
+
+    documents = [
+        build_user_document(user, hashed_password)
+        for (_, user), hashed_password in zip(batch, hashed)
+    ]
+
+    failed_indexes = set()
+    try:
+        await database.get_collection("users").insert_many(documents, ordered=False)
+    except BulkWriteError as bwe:
+        for error in bwe.details.get("writeErrors", []):
+            index = error["index"]
+            failed_indexes.add(index)
+            line, user = batch[index]
+            message = "El nombre de usuario ya está en uso" if error.get("code") == DUPLICATE_KEY_ERROR else error.get("errmsg", "Error de escritura")
+            report.add_error(line, user.username, message)
+
+    report.inserted += len(documents) - len(failed_indexes)
+    for index, (_, user) in enumerate(batch):
+        if index not in failed_indexes:
+            auth.invalidate_user(user.username)
+
+
+async def import_users_ndjson(chunks: AsyncIterator[bytes]) -> Dict:
+    """
+    Importa usuarios desde un flujo NDJSON (un UserCreate por línea).
+
+    Devuelve un informe con los registros recibidos, insertados, los errores
+    por línea y el rendimiento en registros por segundo.
+    """
+    report = BulkImportReport()
+    batch: List[Tuple[int, UserCreate]] = []
+
+    async for line_number, line in _iter_lines(chunks):
+        if line is None:
+            report.received += 1
+            report.add_error(line_number, None, f"Línea de más de {BULK_MAX_LINE_BYTES} bytes")
+            continue
+        if not line.strip():
+            continue
+        if report.received >= BULK_MAX_RECORDS:
+            # El resto del cuerpo no se procesa
+            report.limit_exceeded = True
+            report.add_error(line_number, None, f"Se superó el máximo de {BULK_MAX_RECORDS} registros por petición")
+            break
+        report.received += 1
+        try:
+            user = UserCreate.model_validate_json(line)
+        except ValidationError as e:
+            report.add_error(line_number, None, str(e))
+            continue
+
+        batch.append((line_number, user))
+        if len(batch) >= BULK_BATCH_SIZE:
+            await _flush(batch, report)
+            batch = []
+
+    if batch:
+        await _flush(batch, report)
+
+    result = report.to_dict()
+    logger.info(
+        "Alta masiva completada: %d insertados, %d fallidos",
+        report.inserted, report.failed,
+        extra={"records_per_second": result["records_per_second"]}
+    )
+    return result
@@ -0,0 +1,273 @@
+"""
+Índice de percentiles por sector y país.
+
+Para cada (tipo de puntuación, versión, sector, país) se mantiene una lista
+ordenada con las puntuaciones de todas las empresas del grupo y un diccionario
+con la puntuación actual de cada empresa. Cuando una puntuación se recalcula
+se actualiza su posición en la lista, y el percentil de una empresa frente a
+sus pares se obtiene con búsquedas binarias, sin recorrer a los pares. La
+lista se guarda en bloques ordenados (_SortedScores), de modo que insertar o
+borrar no desplaza todo el grupo como haría insort sobre una lista única.
+
+El índice vive en memoria en cada proceso: se construye al arrancar a partir
+de las puntuaciones materializadas de la colección users y después solo se
+sincroniza cada PEER_INDEX_SYNC_SECONDS con los usuarios cuyas puntuaciones
+han cambiado desde la última vez (scores_materializados.updated_at,
+indexado), lo que recoge los cambios de otros procesos, como rescore_job.
+La reconstrucción completa, que recorre todos los usuarios, solo se repite
+cada PEER_INDEX_REBUILD_SECONDS para descartar empresas borradas; las
+actualizaciones que llegan mientras dura se vuelven a aplicar sobre el
+índice nuevo antes de sustituir al anterior.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+import database
+import score_store
+import scorecard
+
+logger = logging.getLogger(__name__)
+
+PEER_INDEX_SYNC_SECONDS = int(os.getenv("PEER_INDEX_SYNC_SECONDS", "30"))
+PEER_INDEX_REBUILD_SECONDS = int(os.getenv("PEER_INDEX_REBUILD_SECONDS", "86400"))
+
+GroupKey = Tuple[str, Optional[str], str, str]
+
+# Tamaño objetivo de cada bloque de _SortedScores
+_BLOCK = 512
+
+
+def _group(kind: str, version: Optional[str], informacion_general: Dict) -> GroupKey:
+    sector = (informacion_general.get("sector") or "").strip().lower()
+    pais = (informacion_general.get("pais") or "").strip().lower()
+    return (kind, version, sector, pais)
+
+
+class _SortedScores:
+    """
+    Lista ordenada repartida en bloques de como mucho 2 * _BLOCK elementos:
+    insertar o borrar cuesta O(log n + _BLOCK) en lugar de O(n). Los
+    elementos anteriores a cada bloque se acumulan al consultar y se reutilizan
+    hasta la siguiente modificación.
+    """
+
+    def __init__(self):
+        self._blocks: List[List] = []
+        self._maxes: List = []
+        self._len = 0
+        self._offsets: Optional[List[int]] = None
+
+    def _offset(self, i: int) -> int:
+        if self._offsets is None:
+            self._offsets = [0, *accumulate(len(block) for block in self._blocks)]
+        return self._offsets[i]
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, value):
+        self._len += 1
+        self._offsets = None
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            return
+        i = bisect_left(self._maxes, value)
+        if i == len(self._blocks):
+            i -= 1
+            self._blocks[i].append(value)
+            self._maxes[i] = value
+        else:
+            insort(self._blocks[i], value)
+        block = self._blocks[i]
+        if len(block) > 2 * _BLOCK:
+            self._blocks[i:i + 1] = [block[:_BLOCK], block[_BLOCK:]]
+            self._maxes[i:i + 1] = [block[_BLOCK - 1], block[-1]]
+
+    def remove(self, value):
+        # El primer bloque cuyo máximo es >= value contiene value si está en la lista
+        i = bisect_left(self._maxes, value)
+        block = self._blocks[i]
+        del block[bisect_left(block, value)]
+        self._len -= 1
+        self._offsets = None
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+    def count_below(self, value) -> int:
+        i = bisect_left(self._maxes, value)
+        below = self._offset(i)
+        if i < len(self._blocks):
+            below += bisect_left(self._blocks[i], value)
+        return below
+
+    def count_at_most(self, value) -> int:
+        i = bisect_right(self._maxes, value)
+        at_most = self._offset(i)
+        if i < len(self._blocks):
+            at_most += bisect_right(self._blocks[i], value)
+        return at_most
+
+
+class PeerIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores: Dict[GroupKey, _SortedScores] = {}
+        self._members: Dict[GroupKey, Dict[str, float]] = {}
+        self._member_group: Dict[Tuple[str, Optional[str], str], GroupKey] = {}
+        # Actualizaciones recibidas durante una reconstrucción (ver begin_rebuild)
+        self._journal: Optional[List[Tuple]] = None
+
+    def update(self, kind: str, version: Optional[str], informacion_general: Dict, username: str, score):
+        """Registra la puntuación actual de una empresa (O(log n) si no cambia)."""
+        if score is None:
+            return
+        group = _group(kind, version, informacion_general)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((kind, version, group, username, score))
+            self._apply(kind, version, group, username, score)
+
+    def _apply(self, kind: str, version: Optional[str], group: GroupKey, username: str, score):
+        member_key = (kind, version, username)
+        previous_group = self._member_group.get(member_key)
+        if previous_group == group and self._members[group][username] == score:
+            return
+        if previous_group is not None:
+            self._remove(previous_group, username)
+        self._scores.setdefault(group, _SortedScores()).add(score)
+        self._members.setdefault(group, {})[username] = score
+        self._member_group[member_key] = group
+
+    def _remove(self, group: GroupKey, username: str):
+        old_score = self._members[group].pop(username)
+        scores = self._scores[group]
+        scores.remove(old_score)
+        if not scores:
+            del self._scores[group]
+            del self._members[group]
+
+    def percentile(self, kind: str, version: Optional[str], informacion_general: Dict, score) -> Optional[Dict]:
+        """
+        Percentil de la puntuación entre los pares del mismo sector y país:
+        porcentaje de pares por debajo, contando los empates como medio.
+        """
+        group = _group(kind, version, informacion_general)
+        with self._lock:
+            scores = self._scores.get(group)
+            if not scores:
+                return None
+            below = scores.count_below(score)
+            equal = scores.count_at_most(score) - below
+            peers = len(scores)
+        return {
+            "sector": informacion_general.get("sector"),
+            "pais": informacion_general.get("pais"),
+            "percentile": round((below + 0.5 * equal) / peers * 100, 1),
+            "peers": peers,
+        }
+
+    def begin_rebuild(self):
+        """Empieza a anotar las actualizaciones para repetirlas sobre el índice reconstruido."""
+        with self._lock:
+            self._journal = []
+
+    def abort_rebuild(self):
+        with self._lock:
+            self._journal = None
+
+    def replace(self, other: "PeerIndex"):
+        with self._lock:
+            # Lo que llegó mientras se leía la colección no está (o no al día) en other
+            for entry in self._journal or []:
+                other._apply(*entry)
+            self._journal = None
+            self._scores = other._scores
+            self._members = other._members
+            self._member_group = other._member_group
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "groups": len(self._scores),
+                "members": len(self._member_group),
+            }
+
+
+index = PeerIndex()
+
+
+def _projection() -> Dict:
+    field = score_store.MATERIALIZED_FIELD
+    return {
+        "username": 1,
+        "informacion_general.sector": 1,
+        "informacion_general.pais": 1,
+        f"{field}.trust.result.calificacion_global": 1,
+        **{f"{field}.credit.{version}.result.score": 1 for version in scorecard.available_versions()},
+    }
+
+
+def _index_user(target: PeerIndex, usuario: Dict):
+    informacion_general = usuario.get("informacion_general", {})
+    materialized = usuario.get(score_store.MATERIALIZED_FIELD, {})
+    for version, entry in (materialized.get("credit") or {}).items():
+        score = ((entry or {}).get("result") or {}).get("score")
+        target.update("credit", version, informacion_general, usuario["username"], score)
+    trust = ((materialized.get("trust") or {}).get("result") or {}).get("calificacion_global")
+    target.update("trust", None, informacion_general, usuario["username"], trust)
+
+
+async def rebuild() -> Dict:
+    """Reconstruye el índice a partir de las puntuaciones materializadas de todos los usuarios."""
+    fresh = PeerIndex()
+    index.begin_rebuild()
+    try:
+        query = {score_store.MATERIALIZED_FIELD: {"$exists": True}}
+        async for usuario in database.get_collection("users").find(query, _projection(), batch_size=1000):
+            _index_user(fresh, usuario)
+    except BaseException:
+        index.abort_rebuild()
+        raise
+    index.replace(fresh)
+    return index.stats()
+
+
+async def sync(since: datetime) -> int:
+    """Aplica las puntuaciones materializadas que han cambiado desde since."""
+    query = {score_store.UPDATED_AT_FIELD: {"$gte": since}}
+    changed = 0
+    async for usuario in database.get_collection("users").find(query, _projection(), batch_size=1000):
+        _index_user(index, usuario)
+        changed += 1
+    return changed
+
+
+async def refresh_periodically():
+    last_rebuild = None
+    last_sync = None
+    while True:
+        # Solape de un segundo para no perder escrituras concurrentes con la consulta
+        started = datetime.now(timezone.utc) - timedelta(seconds=1)
+        try:
+            if last_rebuild is None or time.monotonic() - last_rebuild >= PEER_INDEX_REBUILD_SECONDS:
+                stats = await rebuild()
+                last_rebuild = time.monotonic()
+                logger.info("Índice de percentiles reconstruido", extra=stats)
+            else:
+                changed = await sync(last_sync)
+                logger.debug("Índice de percentiles sincronizado: %d usuarios con cambios", changed)
+            last_sync = started
+        except Exception:
+            logger.exception("Error actualizando el índice de percentiles")
+        await asyncio.sleep(PEER_INDEX_SYNC_SECONDS)
@@ -0,0 +1,242 @@
+"""
+Recálculo nocturno de las puntuaciones de toda la colección users.
+
+Recorre la colección por páginas (paginación keyset de MongoDBClient), reparte
+el cálculo de calculate_credit_score y calculate_trust_score entre un pool de
+procesos del tamaño de los núcleos disponibles y escribe las puntuaciones
+materializadas (ver score_store.py) con bulk_write por página, junto con las
+instantáneas de histórico de las puntuaciones que han cambiado.
+
+Tras escribir cada página se guarda el token de paginación en un fichero de
+checkpoint; si el proceso se interrumpe, la siguiente ejecución continúa desde
+la última página escrita.
+
+    python rescore_job.py --checkpoint rescore.checkpoint.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import database
+import score_history
+import score_store
+import scorecard
+from mongoclient import MongoDBClient
+
+logger = logging.getLogger(__name__)
+
+def projection(version: str) -> Dict:
+    # Entradas de las puntuaciones y los valores guardados, para detectar cambios en el histórico
+    return {
+        "username": 1,
+        **{field: 1 for field in score_store.CREDIT_INPUT_FIELDS + score_store.TRUST_INPUT_FIELDS},
+        f"{score_store.MATERIALIZED_FIELD}.credit.{version}.result.score": 1,
+        f"{score_store.MATERIALIZED_FIELD}.trust.result.calificacion_global": 1,
+    }
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _score_page(documents: List[Dict], version: str, now: datetime) -> List[Dict]:
+    """Se ejecuta en los procesos del pool: puntúa una página de documentos."""
+    results = []
+    for document in documents:
+        started = time.perf_counter()
+        try:
+            update = score_store.materialize(document, version, now)
+            snapshots = score_store.history_snapshots(document, update, version)
+            error = None
+        except Exception as e:
+            update = None
+            snapshots = []
+            error = f"{type(e).__name__}: {e}"
+        results.append({
+            "_id": document["_id"],
+            "username": document.get("username"),
+            "update": update,
+            "snapshots": snapshots,
+            "error": error,
+            "latency": time.perf_counter() - started,
+        })
+    return results
+
+
+class Checkpoint:
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+    def load(self) -> Optional[Dict]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json_util.loads(f.read())
+
+    def save(self, state: Dict):
+        if not self.path:
+            return
+        # Escritura atómica: un fallo a mitad nunca deja un checkpoint corrupto
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json_util.dumps(state))
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RescoreReport:
+    def __init__(self, processed: int = 0, failed: int = 0):
+        self.processed = processed
+        self.failed = failed
+        self.scored_this_run = 0
+        self.latencies: List[float] = []
+        self.started_at = time.perf_counter()
+
+    def add_page(self, results: List[Dict], write_failures: int):
+        self.processed += len(results)
+        self.scored_this_run += len(results)
+        self.failed += sum(1 for result in results if result["error"]) + write_failures
+        self.latencies.extend(result["latency"] for result in results)
+
+    def to_dict(self) -> Dict:
+        elapsed = time.perf_counter() - self.started_at
+        latencias = sorted(self.latencies)
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "scored_this_run": self.scored_this_run,
+            "elapsed_seconds": round(elapsed, 3),
+            "documents_per_second": round(self.scored_this_run / elapsed, 1) if elapsed > 0 else 0.0,
+            "p50_ms": round(statistics.median(latencias) * 1000, 3) if latencias else None,
+            "p99_ms": round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000, 3) if latencias else None,
+        }
+
+
+async def _write_page(collection, results: List[Dict]) -> int:
+    """Escribe las puntuaciones de una página y devuelve cuántas escrituras fallaron."""
+    scored = [result for result in results if result["update"] is not None]
+    operations = [UpdateOne({"_id": result["_id"]}, {"$set": result["update"]}) for result in scored]
+    for result in results:
+        if result["error"]:
+            logger.warning("No se pudo puntuar a %s: %s", result["username"], result["error"])
+    if not operations:
+        return 0
+    failed_indexes = set()
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as bwe:
+        for error in bwe.details.get("writeErrors", []):
+            failed_indexes.add(error["index"])
+            logger.warning("Error escribiendo la puntuación de %s: %s",
+                           scored[error["index"]]["username"], error.get("errmsg"))
+
+    snapshots = [
+        snapshot
+        for index, result in enumerate(scored) if index not in failed_indexes
+        for snapshot in result["snapshots"]
+    ]
+    try:
+        await score_history.record_many(snapshots)
+    except PyMongoError:
+        logger.warning("No se pudo guardar el histórico de %d puntuaciones", len(snapshots), exc_info=True)
+    return len(failed_indexes)
+
+
+async def run(
+    page_size: int,
+    workers: int,
+    checkpoint: Checkpoint,
+    version: Optional[str] = None,
+    now: Optional[datetime] = None
+) -> Dict:
+    version = scorecard.get_scorecard(version).version
+    state = checkpoint.load()
+    if state and state.get("version") == version:
+        now = datetime.fromisoformat(state["now"])
+        after = state["after"]
+        report = RescoreReport(state["processed"], state["failed"])
+        logger.info("Reanudando el recálculo tras %d documentos", report.processed)
+    else:
+        now = now or datetime.now()
+        after = None
+        report = RescoreReport()
+
+    client = MongoDBClient(database.DB_NAME)
+    collection = client.get_collection("users")
+    loop = asyncio.get_running_loop()
+    # Se leen como mucho dos páginas por proceso por delante de la escritura
+    max_in_flight = workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        async def write_oldest():
+            # Las páginas se escriben en orden, así el checkpoint nunca salta una sin escribir
+            results_future, next_token = pending.popleft()
+            results = await results_future
+            write_failures = await _write_page(collection, results)
+            report.add_page(results, write_failures)
+            checkpoint.save({
+                "version": version,
+                "now": now.isoformat(),
+                "after": next_token,
+                "processed": report.processed,
+                "failed": report.failed,
+            })
+
+        async for page, next_token in client.iter_pages("users", {}, page_size, after, projection=projection(version)):
+            future = loop.run_in_executor(pool, _score_page, page, version, now)
+            pending.append((future, next_token))
+            if len(pending) >= max_in_flight:
+                await write_oldest()
+        while pending:
+            await write_oldest()
+
+    checkpoint.clear()
+    result = report.to_dict()
+    logger.info("Recálculo completado: %d documentos, %d fallidos", report.processed, report.failed)
+    return result
+
+
+async def _main(args):
+    database.init_client()
+    try:
+        result = await run(args.page_size, args.workers, Checkpoint(args.checkpoint), args.scorecard_version)
+        print(json.dumps(result))
+    finally:
+        database.close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula las puntuaciones de todos los usuarios")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=available_cores())
+    parser.add_argument("--checkpoint", default="rescore.checkpoint.json",
+                        help="Fichero donde se guarda el progreso para reanudar")
+    parser.add_argument("--scorecard-version", help="Versión del scorecard (por defecto SCORECARD_VERSION)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
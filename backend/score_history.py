@@ -0,0 +1,186 @@
+"""
+Histórico real de puntuaciones en la colección de series temporales
+score_history.
+
+Cada vez que una puntuación se recalcula y su valor cambia se guarda una
+instantánea {ts, meta: {username, kind, version}, score}. Las consultas de
+histórico piden un rango de fechas y MongoDB agrupa las instantáneas por
+día, mes o trimestre ($dateTrunc), devolviendo el último valor de cada
+periodo junto con el mínimo, el máximo y la media. Como solo se guarda una
+instantánea cuando la puntuación cambia, los periodos sin instantáneas se
+completan con el último valor conocido (samples 0), incluido el anterior al
+rango pedido.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo.errors import PyMongoError
+
+import database
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "score_history"
+GRANULARITIES = ("day", "month", "quarter")
+
+MESES = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+
+def snapshot(username: str, kind: str, score, version: Optional[str] = None,
+             ts: Optional[datetime] = None) -> Dict:
+    return {
+        "ts": ts or datetime.now(timezone.utc),
+        "meta": {"username": username, "kind": kind, "version": version},
+        "score": score,
+    }
+
+
+async def record(username: str, kind: str, score, version: Optional[str] = None):
+    """Guarda una instantánea; si falla, el histórico pierde un punto pero la petición sigue."""
+    try:
+        await database.get_collection(COLLECTION).insert_one(snapshot(username, kind, score, version))
+    except PyMongoError:
+        logger.warning("No se pudo guardar el histórico de %s (%s)", username, kind, exc_info=True)
+
+
+async def record_many(snapshots: List[Dict]):
+    if snapshots:
+        await database.get_collection(COLLECTION).insert_many(snapshots, ordered=False)
+
+
+def history_pipeline(
+    username: str,
+    kind: str,
+    since: datetime,
+    until: datetime,
+    granularity: str = "month",
+    version: Optional[str] = None
+) -> List[Dict]:
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularidad no válida: {granularity}. Opciones: {', '.join(GRANULARITIES)}")
+    match = {
+        "meta.username": username,
+        "meta.kind": kind,
+        "ts": {"$gte": since, "$lt": until},
+    }
+    if version is not None:
+        match["meta.version"] = version
+    return [
+        {"$match": match},
+        {"$sort": {"ts": 1}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$ts", "unit": granularity}},
+            "score": {"$last": "$score"},
+            "min": {"$min": "$score"},
+            "max": {"$max": "$score"},
+            "avg": {"$avg": "$score"},
+            "samples": {"$sum": 1},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": 0,
+            "period": "$_id",
+            "score": 1,
+            "min": 1,
+            "max": 1,
+            "avg": {"$round": ["$avg", 2]},
+            "samples": 1,
+        }},
+    ]
+
+
+def _utc_naive(ts: datetime) -> datetime:
+    """MongoDB devuelve fechas UTC sin zona horaria: se comparan en esa forma."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _truncate(ts: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return datetime(ts.year, ts.month, ts.day)
+    month = ts.month if granularity == "month" else (ts.month - 1) // 3 * 3 + 1
+    return datetime(ts.year, month, 1)
+
+
+def _next_period(period: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return period + timedelta(days=1)
+    month = period.month - 1 + (1 if granularity == "month" else 3)
+    return datetime(period.year + month // 12, month % 12 + 1, 1)
+
+
+def fill_periods(rows: List[Dict], since: datetime, until: datetime, granularity: str,
+                 previous_score=None) -> List[Dict]:
+    """Completa los periodos sin instantáneas del rango con el último valor conocido."""
+    by_period = {_utc_naive(row["period"]): row for row in rows}
+    filled = []
+    last = previous_score
+    period = _truncate(_utc_naive(since), granularity)
+    end = _utc_naive(until)
+    while period < end:
+        row = by_period.get(period)
+        if row is not None:
+            last = row["score"]
+            filled.append(row)
+        elif last is not None:
+            filled.append({"period": period, "score": last, "min": last, "max": last, "avg": last, "samples": 0})
+        period = _next_period(period, granularity)
+    return filled
+
+
+async def _score_before(username: str, kind: str, since: datetime, version: Optional[str]):
+    """Última puntuación anterior al rango, para arrastrarla a sus primeros periodos."""
+    query = {"meta.username": username, "meta.kind": kind, "ts": {"$lt": since}}
+    if version is not None:
+        query["meta.version"] = version
+    previous = await database.get_collection(COLLECTION).find_one(query, {"score": 1}, sort=[("ts", -1)])
+    return previous["score"] if previous else None
+
+
+async def get_history(
+    username: str,
+    kind: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "month",
+    version: Optional[str] = None
+) -> List[Dict]:
+    """Histórico agregado por periodo; por defecto, los últimos doce meses por mes."""
+    until = until or datetime.now(timezone.utc)
+    since = since or until - timedelta(days=365)
+    pipeline = history_pipeline(username, kind, since, until, granularity, version)
+    cursor = database.get_collection(COLLECTION).aggregate(pipeline)
+    rows = [row async for row in cursor]
+    previous_score = await _score_before(username, kind, since, version)
+    return fill_periods(rows, since, until, granularity, previous_score)
+
+
+def period_label(period: datetime, granularity: str) -> str:
+    if granularity == "day":
+        return period.strftime("%Y-%m-%d")
+    if granularity == "quarter":
+        return f"T{(period.month - 1) // 3 + 1} {period.year}"
+    return f"{MESES[period.month - 1]} {period.year}"
+
+
+async def credit_chart_history(username: str, version: str, months: int = 6) -> List[Dict]:
+    """Histórico mensual con la forma de generate_credit_score_history ({month, score})."""
+    rows = await get_history(username, "credit", since=datetime.now(timezone.utc) - timedelta(days=31 * months),
+                             granularity="month", version=version)
+    return [{"month": MESES[row["period"].month - 1], "score": row["score"]} for row in rows[-months:]]
+
+
+async def trust_chart_history(username: str, months: int = 12) -> List[Dict]:
+    """Histórico mensual con la forma de generar_historico_trust_score ({fecha, puntuacion, etiqueta})."""
+    rows = await get_history(username, "trust", since=datetime.now(timezone.utc) - timedelta(days=31 * months),
+                             granularity="month")
+    return [
+        {
+            "fecha": row["period"].strftime("%Y-%m-%d"),
+            "puntuacion": row["score"],
+            "etiqueta": period_label(row["period"], "month"),
+        }
+        for row in rows[-months:]
+    ]
@@ -0,0 +1,228 @@
+"""
+Puntuaciones materializadas: el resultado de calculate_credit_score y
+calculate_trust_score se guarda en el propio documento del usuario, junto a
+un hash de los subdocumentos de entrada.
+
+Mientras el hash coincide se sirve el resultado guardado; si los datos de la
+empresa cambian (o la versión del scorecard o el contenido de su fichero, o
+el día de cálculo, del que dependen la antigüedad de las cuentas y las
+etiquetas del histórico) el hash deja de coincidir y la puntuación se
+recalcula y se vuelve a guardar.
+Si al recalcular cambia el valor de la puntuación, se añade una instantánea
+al histórico (ver score_history.py).
+
+Las puntuaciones que sirve la API guardan también la gráfica del histórico
+real (o la simulada si aún no hay instantáneas), de modo que un acierto no
+consulta score_history. Las entradas materializadas por lotes no
+la incluyen ("history_chart" ausente) y se completan en la primera petición.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo.errors import PyMongoError
+
+import auth
+import database
+import score_calculator
+import score_history
+import scorecard
+
+logger = logging.getLogger(__name__)
+
+MATERIALIZED_FIELD = "scores_materializados"
+# Última escritura de cualquier puntuación materializada del usuario (ver peer_index.sync)
+UPDATED_AT_FIELD = f"{MATERIALIZED_FIELD}.updated_at"
+
+# Campos de los que depende cada puntuación (los mismos que proyectan los endpoints)
+CREDIT_INPUT_FIELDS = (
+    "historial_crediticio",
+    "informacion_general.fecha_fundacion",
+    "informacion_general.tamano_empresa",
+)
+TRUST_INPUT_FIELDS = (
+    "pyme360_trust_score",
+    "informacion_general.fecha_fundacion",
+    "informacion_general.tamano_empresa",
+    "informacion_general.sector",
+)
+
+# Campo del resultado que se guarda en el histórico
+SCORE_KEYS = {"credit": "score", "trust": "calificacion_global"}
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.write_errors = 0
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_write_error(self):
+        with self._lock:
+            self.write_errors += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "write_errors": self.write_errors,
+            }
+
+
+stats = _Stats()
+
+
+def _get_path(document: Dict, path: str):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def input_hash(usuario: Dict, fields: Iterable[str], version: Optional[str], now: datetime) -> str:
+    """Hash estable de los campos de entrada, el scorecard (versión y contenido) y el día de cálculo."""
+    payload = {
+        "campos": {field: _get_path(usuario, field) for field in fields},
+        "version": version,
+        "scorecard": scorecard.get_scorecard(version).digest if version else None,
+        "fecha": now.date().isoformat(),
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _entry(digest: str, result: Dict, now: datetime, history_chart: bool = False) -> Dict:
+    entry = {"input_hash": digest, "result": result, "computed_at": now}
+    if history_chart:
+        entry["history_chart"] = True
+    return entry
+
+
+async def _store(username: str, path: str, entry: Dict):
+    try:
+        await database.get_collection("users").update_one(
+            {"username": username},
+            {"$set": {path: entry, UPDATED_AT_FIELD: datetime.now(timezone.utc), **database.users_update_stamp()}}
+        )
+    except PyMongoError:
+        # La materialización es una optimización: si falla, se recalcula en la siguiente petición
+        stats.record_write_error()
+        logger.warning("No se pudo guardar la puntuación materializada de %s", username, exc_info=True)
+        return
+    auth.invalidate_user(username)
+
+
+def _score_changed(kind: str, stored: Optional[Dict], result: Dict) -> bool:
+    previous = (stored or {}).get("result") or {}
+    return previous.get(SCORE_KEYS[kind]) != result.get(SCORE_KEYS[kind])
+
+
+async def _get_or_compute(usuario: Dict, kind: str, fields, version: Optional[str], now: datetime, compute,
+                          add_history=None) -> Dict:
+    """
+    add_history (opcional) completa el resultado recién calculado con su
+    histórico antes de guardarlo; solo se aceptan como acierto las entradas
+    que ya lo incluyen.
+    """
+    key = f"{kind}.{version}" if version else kind
+    digest = input_hash(usuario, fields, version, now)
+    stored = _get_path(usuario, f"{MATERIALIZED_FIELD}.{key}")
+    if stored and stored.get("input_hash") == digest and (add_history is None or stored.get("history_chart")):
+        stats.record(hit=True)
+        # Copia: el resultado vive dentro del documento cacheado del usuario
+        return dict(stored["result"])
+
+    stats.record(hit=False)
+    result = compute()
+    if "username" in usuario and _score_changed(kind, stored, result):
+        await score_history.record(usuario["username"], kind, result.get(SCORE_KEYS[kind]), version)
+    if add_history is not None:
+        await add_history(result)
+    if "username" in usuario:
+        entry = _entry(digest, result, now, history_chart=add_history is not None)
+        await _store(usuario["username"], f"{MATERIALIZED_FIELD}.{key}", entry)
+    return dict(result)
+
+
+async def get_credit_score(usuario: Dict, version: Optional[str] = None, now: Optional[datetime] = None) -> Dict:
+    """calculate_credit_score materializado por versión de scorecard, con la gráfica del histórico real."""
+    now = now or datetime.now()
+    version = scorecard.get_scorecard(version).version
+
+    async def add_history(result: Dict):
+        history = []
+        if "username" in usuario:
+            history = await score_history.credit_chart_history(usuario["username"], version)
+        result["history"] = history or score_calculator.generate_credit_score_history(result["score"], now)
+
+    return await _get_or_compute(
+        usuario, "credit", CREDIT_INPUT_FIELDS, version, now,
+        lambda: score_calculator.calculate_credit_score(usuario, now, version, include_history=False),
+        add_history
+    )
+
+
+async def get_trust_score(usuario: Dict, now: Optional[datetime] = None) -> Dict:
+    """calculate_trust_score materializado, con la gráfica del histórico real."""
+    now = now or datetime.now()
+
+    async def add_history(result: Dict):
+        if "username" in usuario:
+            historico = await score_history.trust_chart_history(usuario["username"])
+            if historico:
+                result["historico"] = historico
+
+    return await _get_or_compute(
+        usuario, "trust", TRUST_INPUT_FIELDS, None, now,
+        lambda: score_calculator.calculate_trust_score(usuario),
+        add_history
+    )
+
+
+def materialize(usuario: Dict, version: Optional[str] = None, now: Optional[datetime] = None) -> Dict:
+    """
+    Calcula las dos puntuaciones de un usuario y devuelve el $set que las
+    materializa, sin escribirlo (lo usan los procesos por lotes).
+    """
+    now = now or datetime.now()
+    version = scorecard.get_scorecard(version).version
+    credit_hash = input_hash(usuario, CREDIT_INPUT_FIELDS, version, now)
+    trust_hash = input_hash(usuario, TRUST_INPUT_FIELDS, None, now)
+    credit = score_calculator.calculate_credit_score(usuario, now, version)
+    trust = score_calculator.calculate_trust_score(usuario)
+    return {
+        f"{MATERIALIZED_FIELD}.credit.{version}": _entry(credit_hash, credit, now),
+        f"{MATERIALIZED_FIELD}.trust": _entry(trust_hash, trust, now),
+        UPDATED_AT_FIELD: datetime.now(timezone.utc),
+        **database.users_update_stamp(),
+    }
+
+
+def history_snapshots(usuario: Dict, update: Dict, version: str) -> List[Dict]:
+    """Instantáneas de histórico para las puntuaciones de `update` que cambian respecto a las guardadas."""
+    snapshots = []
+    for kind, key in (("credit", f"credit.{version}"), ("trust", "trust")):
+        path = f"{MATERIALIZED_FIELD}.{key}"
+        result = update[path]["result"]
+        if _score_changed(kind, _get_path(usuario, path), result):
+            snapshots.append(score_history.snapshot(
+                usuario.get("username"), kind, result.get(SCORE_KEYS[kind]),
+                version if kind == "credit" else None
+            ))
+    return snapshots
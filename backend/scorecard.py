@@ -0,0 +1,361 @@
+"""
+Motor de scorecards declarativos para la puntuación crediticia.
+
+Las bandas de cada componente, sus pesos, la escala final y las reglas de
+puntuación simulada se leen de ficheros versionados en scorecards/<versión>.json.
+Añadir un fichero nuevo permite evaluar otra versión (por ejemplo, en una
+prueba A/B) sin tocar el código.
+
+Cada banda se resuelve con una búsqueda binaria (bisect) sobre los umbrales
+en lugar de una cadena de if/elif, y evaluate_components() calcula los cinco
+componentes recorriendo el historial crediticio una sola vez;
+evaluate_component() calcula uno solo. Las fechas llegan normalmente ya
+convertidas a datetime (ver date_normalization.py); las que siguen siendo
+cadenas (documentos aún no migrados) se parsean al leerlas, y las que no
+son fechas válidas se ignoran.
+"""
+import hashlib
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import date_normalization
+
+SCORECARDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scorecards")
+DEFAULT_VERSION = os.getenv("SCORECARD_VERSION", "v1")
+
+
+class Bands:
+    """
+    Tabla de bandas de un componente.
+
+    tipo "min": la puntuación es la de la mayor banda con valor >= umbral.
+    tipo "max": la puntuación es la de la menor banda con valor <= umbral.
+    Fuera de todas las bandas se usa "defecto", o int(valor * defecto_factor).
+    """
+
+    def __init__(self, config: Dict):
+        self.kind = config["tipo"]
+        self.thresholds: List[float] = list(config["umbrales"])
+        self.scores: List[int] = list(config["puntos"])
+        self.default: Optional[int] = config.get("defecto")
+        self.default_factor: Optional[float] = config.get("defecto_factor")
+
+        if self.kind not in ("min", "max"):
+            raise ValueError(f"Tipo de banda desconocido: {self.kind}")
+        if len(self.thresholds) != len(self.scores):
+            raise ValueError("Cada umbral necesita su puntuación")
+        if self.thresholds != sorted(self.thresholds):
+            raise ValueError("Los umbrales deben estar en orden ascendente")
+        if (self.default is None) == (self.default_factor is None):
+            raise ValueError("Hay que indicar 'defecto' o 'defecto_factor'")
+
+    def _default_for(self, value) -> int:
+        if self.default is not None:
+            return self.default
+        return int(value * self.default_factor)
+
+    def lookup(self, value) -> int:
+        if self.kind == "min":
+            idx = bisect_right(self.thresholds, value) - 1
+            return self.scores[idx] if idx >= 0 else self._default_for(value)
+        idx = bisect_left(self.thresholds, value)
+        return self.scores[idx] if idx < len(self.scores) else self._default_for(value)
+
+    def lookup_array(self, values):
+        """Versión vectorizada de lookup() para arrays de NumPy."""
+        import numpy as np
+
+        values = np.asarray(values)
+        thresholds = np.asarray(self.thresholds)
+        scores = np.asarray(self.scores, dtype=np.int64)
+        if self.default is not None:
+            default = np.full(values.shape, self.default, dtype=np.int64)
+        else:
+            default = np.trunc(values * self.default_factor).astype(np.int64)
+
+        if self.kind == "min":
+            idx = np.searchsorted(thresholds, values, side="right") - 1
+            in_band = idx >= 0
+        else:
+            idx = np.searchsorted(thresholds, values, side="left")
+            in_band = idx < len(scores)
+        return np.where(in_band, scores[np.clip(idx, 0, len(scores) - 1)], default)
+
+
+class Component:
+    def __init__(self, config: Dict):
+        self.name: str = config["nombre"]
+        self.weight: float = config["peso"]
+        self.no_data_score: Optional[int] = config.get("sin_datos")
+        self.bands = Bands(config["bandas"])
+
+
+def as_datetime(value) -> Optional[datetime]:
+    """La fecha como datetime, parseando las cadenas sin normalizar; None si no es válida."""
+    if isinstance(value, datetime) or value is None:
+        return value
+    value = date_normalization.parse_date(value)
+    return value if isinstance(value, datetime) else None
+
+
+def _account_age(cuenta: Dict, now: datetime) -> Optional[Dict]:
+    fecha_apertura = as_datetime(cuenta.get("fecha_apertura"))
+    if fecha_apertura is None:
+        return None
+    return {
+        "name": cuenta.get("entidad", "Cuenta"),
+        "years": (now - fecha_apertura).days / 365.25
+    }
+
+
+class Scorecard:
+    def __init__(self, config: Dict):
+        self.version: str = config["version"]
+        # Huella del contenido: cambia si se edita el fichero aunque no cambie la versión
+        canonical = json.dumps(config, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        self.digest: str = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        self.components: Dict[str, Component] = {}
+        for component_config in config["componentes"]:
+            component = Component(component_config)
+            self.components[component.name] = component
+        self.scale_min = config["escala"]["min"]
+        self.scale_range = config["escala"]["rango"]
+        self.applications_window_months = config["ventana_solicitudes_meses"]
+        self.simulation = config["simulacion"]
+
+    def band(self, component_name: str) -> Bands:
+        return self.components[component_name].bands
+
+    def weight(self, component_name: str) -> float:
+        return self.components[component_name].weight
+
+    def evaluate_components(self, usuario_data: Dict, now: datetime) -> Dict[str, Dict]:
+        """
+        Calcula los cinco componentes del puntaje en una sola pasada sobre
+        el historial crediticio.
+        """
+        historial_crediticio = usuario_data.get("historial_crediticio", {})
+        cuentas_credito = historial_crediticio.get("cuentas_credito", [])
+        credito_proveedores = historial_crediticio.get("credito_proveedores", [])
+
+        total_payments = 0
+        late_payments = 0
+        total_debt = 0
+        total_available = 0
+        account_ages = []
+        credit_types = set()
+
+        for cuenta in cuentas_credito:
+            historial_pagos = cuenta.get("historial_pagos", [])
+            total_payments += len(historial_pagos)
+            for pago in historial_pagos:
+                if "atrasado" in pago.get("estado", "").lower():
+                    late_payments += 1
+
+            total_debt += cuenta.get("saldo_actual", 0)
+            total_available += cuenta.get("limite_credito", 0)
+
+            account_age = _account_age(cuenta, now)
+            if account_age is not None:
+                account_ages.append(account_age)
+
+            if "tipo" in cuenta:
+                credit_types.add(cuenta["tipo"])
+
+        for proveedor in credito_proveedores:
+            historial_pagos = proveedor.get("historial_pagos", [])
+            total_payments += len(historial_pagos)
+            for pago in historial_pagos:
+                if "atrasado" in pago.get("estado", "").lower():
+                    late_payments += 1
+
+            total_debt += proveedor.get("saldo_actual", 0)
+            total_available += proveedor.get("limite_credito", 0)
+
+        if credito_proveedores:
+            credit_types.add("Crédito Comercial")
+
+        return {
+            "payment_history": self.payment_history(total_payments, late_payments),
+            "credit_utilization": self.credit_utilization(total_debt, total_available),
+            "history_length": self.history_length(account_ages),
+            "credit_mix": self.credit_mix(credit_types),
+            "new_applications": self.new_applications(self._count_recent_applications(historial_crediticio, now)),
+        }
+
+    def evaluate_component(self, name: str, historial_crediticio: Dict, now: datetime) -> Dict:
+        """
+        Calcula un único componente recorriendo solo los datos que usa, para
+        quien no necesita los cinco (ver score_calculator.py).
+        """
+        cuentas_credito = historial_crediticio.get("cuentas_credito", [])
+        credito_proveedores = historial_crediticio.get("credito_proveedores", [])
+
+        if name == "payment_history":
+            total_payments = 0
+            late_payments = 0
+            for cuenta in (*cuentas_credito, *credito_proveedores):
+                historial_pagos = cuenta.get("historial_pagos", [])
+                total_payments += len(historial_pagos)
+                for pago in historial_pagos:
+                    if "atrasado" in pago.get("estado", "").lower():
+                        late_payments += 1
+            return self.payment_history(total_payments, late_payments)
+
+        if name == "credit_utilization":
+            cuentas = (*cuentas_credito, *credito_proveedores)
+            return self.credit_utilization(
+                sum(cuenta.get("saldo_actual", 0) for cuenta in cuentas),
+                sum(cuenta.get("limite_credito", 0) for cuenta in cuentas)
+            )
+
+        if name == "history_length":
+            account_ages = [_account_age(cuenta, now) for cuenta in cuentas_credito]
+            return self.history_length([age for age in account_ages if age is not None])
+
+        if name == "credit_mix":
+            credit_types = {cuenta["tipo"] for cuenta in cuentas_credito if "tipo" in cuenta}
+            if credito_proveedores:
+                credit_types.add("Crédito Comercial")
+            return self.credit_mix(credit_types)
+
+        if name == "new_applications":
+            return self.new_applications(self._count_recent_applications(historial_crediticio, now))
+
+        raise KeyError(name)
+
+    def _count_recent_applications(self, historial_crediticio: Dict, now: datetime) -> int:
+        recent_applications = 0
+        for solicitud in historial_crediticio.get("solicitudes_credito_recientes", []):
+            fecha_solicitud = as_datetime(solicitud.get("fecha"))
+            if fecha_solicitud is not None:
+                months_diff = (now.year - fecha_solicitud.year) * 12 + now.month - fecha_solicitud.month
+                if months_diff <= self.applications_window_months:
+                    recent_applications += 1
+        return recent_applications
+
+    def payment_history(self, total_payments: int, late_payments: int) -> Dict:
+        component = self.components["payment_history"]
+        if total_payments == 0:
+            score_value = component.no_data_score
+            percentage = 100
+            on_time_payments = 0
+        else:
+            on_time_payments = total_payments - late_payments
+            percentage = (on_time_payments / total_payments) * 100
+            score_value = component.bands.lookup(percentage)
+        return {
+            "score": score_value,
+            "percentage": percentage,
+            "weight": component.weight,
+            "total_payments": total_payments,
+            "on_time_payments": on_time_payments,
+            "late_payments": late_payments
+        }
+
+    def credit_utilization(self, total_debt, total_available) -> Dict:
+        component = self.components["credit_utilization"]
+        if total_available == 0:
+            utilization_pct = 0
+            score_value = component.no_data_score
+        else:
+            utilization_pct = (total_debt / total_available) * 100
+            score_value = component.bands.lookup(utilization_pct)
+        return {
+            "score": score_value,
+            "utilization": utilization_pct,
+            "weight": component.weight,
+            "total_debt": total_debt,
+            "total_available": total_available
+        }
+
+    def history_length(self, account_ages: List[Dict]) -> Dict:
+        component = self.components["history_length"]
+        if not account_ages:
+            avg_age = 0
+            score_value = component.no_data_score
+        else:
+            avg_age = sum(account["years"] for account in account_ages) / len(account_ages)
+            score_value = component.bands.lookup(avg_age)
+        return {
+            "score": score_value,
+            "average_age": avg_age,
+            "weight": component.weight,
+            "num_accounts": len(account_ages),
+            "accounts": account_ages
+        }
+
+    def credit_mix(self, credit_types: set) -> Dict:
+        component = self.components["credit_mix"]
+        num_types = len(credit_types)
+        return {
+            "score": component.bands.lookup(num_types),
+            "num_types": num_types,
+            "types": list(credit_types),
+            "weight": component.weight
+        }
+
+    def new_applications(self, recent_applications: int) -> Dict:
+        component = self.components["new_applications"]
+        return {
+            "score": component.bands.lookup(recent_applications),
+            "recent_applications": recent_applications,
+            "weight": component.weight
+        }
+
+    def simulated_score(self, informacion_general: Dict, now: datetime) -> int:
+        """Puntaje base para empresas sin historial crediticio."""
+        sim = self.simulation
+        base_score = sim["base_defecto"]
+        fecha_fundacion = as_datetime(informacion_general.get("fecha_fundacion"))
+        if fecha_fundacion is not None:
+            years_active = (now - fecha_fundacion).days / 365.25
+            base_score = min(max(int(years_active * sim["factor_antiguedad"]), sim["base_min"]), sim["base_max"])
+
+        tamano = informacion_general.get("tamano_empresa", "").lower()
+        size_modifier = sim["modificadores_tamano"].get(tamano, sim["modificador_tamano_defecto"])
+        return min(max(base_score + size_modifier, sim["min"]), sim["max"])
+
+    def apply_simulation(self, components: Dict[str, Dict], simulated_score: int):
+        for name, offset in self.simulation["ajustes"].items():
+            components[name]["score"] = simulated_score + offset
+
+    def final_score(self, components: Dict[str, Dict]) -> int:
+        weighted_score = sum(
+            components[name]["score"] * component.weight
+            for name, component in self.components.items()
+        )
+        return int(self.scale_min + (weighted_score / 100) * self.scale_range)
+
+
+_scorecards: Dict[str, Scorecard] = {}
+_lock = threading.Lock()
+
+
+def available_versions() -> List[str]:
+    return sorted(
+        filename[:-len(".json")]
+        for filename in os.listdir(SCORECARDS_DIR)
+        if filename.endswith(".json")
+    )
+
+
+def get_scorecard(version: Optional[str] = None) -> Scorecard:
+    """Devuelve el scorecard de la versión indicada (por defecto SCORECARD_VERSION)."""
+    version = version or DEFAULT_VERSION
+    scorecard = _scorecards.get(version)
+    if scorecard is not None:
+        return scorecard
+
+    if version not in available_versions():
+        raise ValueError(f"Versión de scorecard desconocida: {version}")
+
+    with _lock:
+        if version not in _scorecards:
+            with open(os.path.join(SCORECARDS_DIR, f"{version}.json"), "r", encoding="utf-8") as f:
+                _scorecards[version] = Scorecard(json.load(f))
+        return _scorecards[version]
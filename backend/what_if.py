@@ -0,0 +1,144 @@
+"""
+Simulador "¿qué pasaría si...?" de la puntuación crediticia.
+
+Cada escenario describe variaciones sobre el historial crediticio actual
+(saldos y límites por cuenta, pagos nuevos, solicitudes de crédito). El
+historial se recorre una sola vez para obtener los totales de partida y
+después todos los escenarios se evalúan a la vez con NumPy, como filas de
+una matriz escenarios x cuentas.
+
+Para cada escenario el resultado coincide con el de calculate_credit_score
+sobre el historial modificado. La antigüedad y la mezcla de créditos no
+cambian en ningún escenario, y las empresas sin historial mantienen su
+puntuación simulada.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import score_calculator
+import scorecard
+
+
+def _line_matrix(escenarios: List[Dict], field: str, ids: Dict, n: int, num_lines: int) -> np.ndarray:
+    deltas = np.zeros((n, num_lines), dtype=np.float64)
+    for i, escenario in enumerate(escenarios):
+        for line_id, delta in (escenario.get(field) or {}).items():
+            if line_id not in ids:
+                raise ValueError(f"Escenario {i}: cuenta desconocida '{line_id}'")
+            deltas[i, ids[line_id]] += delta
+    return deltas
+
+
+def _totals(base: List, deltas: np.ndarray) -> np.ndarray:
+    """Suma por escenario en el mismo orden que el cálculo por usuario (cuentas y luego proveedores)."""
+    total = np.zeros(deltas.shape[0], dtype=np.float64)
+    for j, value in enumerate(base):
+        column = np.where(deltas[:, j] != 0, np.maximum(value + deltas[:, j], 0), value)
+        total = total + column
+    return total
+
+
+def simulate(
+    usuario_data: Dict,
+    escenarios: List[Dict],
+    now: Optional[datetime] = None,
+    version: Optional[str] = None
+) -> Dict:
+    """
+    Evalúa los escenarios sobre el historial del usuario y devuelve la
+    puntuación de cada uno junto con la distribución de puntuaciones.
+
+    Cada escenario admite: nombre, ajustes_saldo y ajustes_limite (id de
+    cuenta o proveedor -> variación), variacion_solicitudes, pagos_puntuales
+    y pagos_atrasados.
+    """
+    now = now or datetime.now()
+    card = scorecard.get_scorecard(version)
+    base = score_calculator.calculate_credit_score(usuario_data, now, card.version)
+    n = len(escenarios)
+
+    historial = usuario_data.get("historial_crediticio", {})
+    lines = historial.get("cuentas_credito", []) + historial.get("credito_proveedores", [])
+
+    if not lines:
+        scores = np.full(n, base["score"], dtype=np.int64)
+        component_scores = {
+            name: np.full(n, component["score"]) for name, component in base["components"].items()
+        }
+    else:
+        components = base["components"]
+        ids = {line["id"]: j for j, line in enumerate(lines) if "id" in line}
+
+        saldo_deltas = _line_matrix(escenarios, "ajustes_saldo", ids, n, len(lines))
+        limite_deltas = _line_matrix(escenarios, "ajustes_limite", ids, n, len(lines))
+        total_debt = _totals([line.get("saldo_actual", 0) for line in lines], saldo_deltas)
+        total_available = _totals([line.get("limite_credito", 0) for line in lines], limite_deltas)
+
+        puntuales = np.array([e.get("pagos_puntuales", 0) for e in escenarios], dtype=np.int64)
+        atrasados = np.array([e.get("pagos_atrasados", 0) for e in escenarios], dtype=np.int64)
+        total_payments = components["payment_history"]["total_payments"] + puntuales + atrasados
+        late_payments = components["payment_history"]["late_payments"] + atrasados
+
+        variacion = np.array([e.get("variacion_solicitudes", 0) for e in escenarios], dtype=np.int64)
+        recent_applications = np.maximum(components["new_applications"]["recent_applications"] + variacion, 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percentage = ((total_payments - late_payments) / np.maximum(total_payments, 1)) * 100
+            utilization = (total_debt / np.where(total_available != 0, total_available, 1)) * 100
+
+        payment_score = np.where(
+            total_payments == 0,
+            card.components["payment_history"].no_data_score,
+            card.band("payment_history").lookup_array(percentage)
+        )
+        utilization_score = np.where(
+            total_available == 0,
+            card.components["credit_utilization"].no_data_score,
+            card.band("credit_utilization").lookup_array(utilization)
+        )
+
+        component_scores = {
+            "payment_history": payment_score,
+            "credit_utilization": utilization_score,
+            "history_length": np.full(n, components["history_length"]["score"]),
+            "credit_mix": np.full(n, components["credit_mix"]["score"]),
+            "new_applications": card.band("new_applications").lookup_array(recent_applications),
+        }
+        # Mismo orden de suma que Scorecard.final_score
+        weighted = sum(
+            component_scores[name] * component.weight
+            for name, component in card.components.items()
+        )
+        scores = np.trunc(card.scale_min + (weighted / 100) * card.scale_range).astype(np.int64)
+
+    columns = {name: values.tolist() for name, values in component_scores.items()}
+    results = []
+    for i, (escenario, score) in enumerate(zip(escenarios, scores.tolist())):
+        results.append({
+            "nombre": escenario.get("nombre") or f"Escenario {i + 1}",
+            "score": score,
+            "delta": score - base["score"],
+            "components": {name: values[i] for name, values in columns.items()},
+        })
+
+    distribution = None
+    if n:
+        p10, p50, p90 = np.percentile(scores, [10, 50, 90]).tolist()
+        distribution = {
+            "min": int(scores.min()),
+            "max": int(scores.max()),
+            "mean": round(float(scores.mean()), 2),
+            "p10": p10,
+            "p50": p50,
+            "p90": p90,
+            "best_scenario": results[int(scores.argmax())]["nombre"],
+        }
+
+    return {
+        "base_score": base["score"],
+        "scorecard_version": card.version,
+        "scenarios": results,
+        "distribution": distribution,
+    }